@@ -1,31 +1,262 @@
 import abc
+import codecs
 import logging
-import math
+import os
+import socket
+import threading
 import time
 import urllib.parse
-from typing import Type
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple, Type
 
-import cchardet
 import requests
+from charset_normalizer import detect
+from requests.adapters import HTTPAdapter
+from urllib3 import poolmanager
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from .exceptions import RequestFailure, RequestsHTTPError, RequestTimeout
 from .log import RawLogger, Timer
 from .pagination import PaginatorInterface
-from .request import RateLimiterInterface, RequestStrategy, SignalTimeout
+from .request import (
+    RATE_LIMIT_PADDING_S,
+    RequestStrategy,
+    RetryBudget,
+    ThreadTimeout,
+    cap_timeout,
+)
 from .response import AbstractProcessor
+from .utils import is_text_content_type
 
 
-# Monkey-patch requests to have it use cchardet instead of chardet
+# Monkey-patch requests to have it use charset_normalizer instead of chardet
 # (for performance / resource consumption reasons)
+# cchardet used to fill that role, but it is unmaintained and does not build on
+# Python 3.10+.
 # TODO: mention benchmark
 # cf https://github.com/psf/requests/issues/2359#issuecomment-552736992
-class ForceCchardet:
+class ForceCharsetNormalizer:
+    # UTF-16 and UTF-32 BOMs (UTF-32-LE starts like UTF-16-LE)
+    WIDE_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE, codecs.BOM_UTF32_BE)
+
+    # Detectors converge well before that, no need to scan multi-MB payloads
+    SNIFF_WINDOW = 65536
+
+    # Response attribute holding the result of a detection run in the background
+    # (as a tuple of the pid of the process that started it, and the future)
+    FUTURE_ATTR = "_apifetch_apparent_encoding"
+
     @property
     def apparent_encoding(obj):
-        return cchardet.detect(obj.content)["encoding"]
+        # Detection may already have been started in the background by the fetcher
+        pending = obj.__dict__.get(ForceCharsetNormalizer.FUTURE_ATTR)
+        if pending is not None:
+            pid, future = pending
+            # (one still pending before a fork never completes in the child)
+            if pid == os.getpid() or future.done():
+                return future.result()
+        return ForceCharsetNormalizer.detect_encoding(obj)
+
+    @staticmethod
+    def detect_encoding(obj):
+        # Do not bother detecting a charset on payloads that are obviously binary
+        # (a payload without a content type still gets a detection)
+        content_type = obj.headers.get("content-type")
+        if content_type and not is_text_content_type(content_type):
+            return None
+
+        content = obj.content
+        if len(content) == 0:
+            return None
+        # A UTF-8 BOM is unambiguous, no need to run the detector
+        if content.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        # NUL bytes do not show up in text, except in UTF-16/32 (which we only
+        # consider when introduced by a BOM)
+        if (
+            not content.startswith(ForceCharsetNormalizer.WIDE_BOMS)
+            and b"\x00" in content[:512]
+        ):
+            return None
+        return detect(content[: ForceCharsetNormalizer.SNIFF_WINDOW])["encoding"]
+
+
+requests.Response.apparent_encoding = ForceCharsetNormalizer.apparent_encoding  # type: ignore
+
+# When the response does not declare its charset, detection is started right away
+# in the background, so that it overlaps with the next request instead of being
+# paid when the caller first accesses response.text.
+# The pool is created on first use, and again in a forked child (its workers are
+# not carried over by fork).
+_ENCODING_POOL: Optional[ThreadPoolExecutor] = None
+_ENCODING_POOL_LOCK = threading.Lock()
+
+
+def _encoding_pool() -> ThreadPoolExecutor:
+    global _ENCODING_POOL
+    if _ENCODING_POOL is None:
+        with _ENCODING_POOL_LOCK:
+            if _ENCODING_POOL is None:
+                _ENCODING_POOL = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="apifetch-encoding"
+                )
+    return _ENCODING_POOL
+
+
+def _reset_encoding_pool():
+    global _ENCODING_POOL, _ENCODING_POOL_LOCK
+    _ENCODING_POOL = None
+    _ENCODING_POOL_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_encoding_pool)
+
+
+# Hard timeout on the total time of a try: a watchdog thread shuts the sockets of
+# the try down, which makes the pending read fail. The connections are registered
+# when they are taken from the pool, so that this also covers the wait for the
+# response headers (send() blocks on it, and does not hand the connection over).
+_KILL_SWITCHES = threading.local()
+
+
+class _KillSwitch(object):
+    __slots__ = ("_lock", "_connections", "_responses")
+
+    _connections: Set
+    _responses: List[requests.Response]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._responses = []
+
+    def add_connection(self, conn):
+        with self._lock:
+            self._connections.add(conn)
+
+    def discard_connection(self, conn):
+        # Back to the pool: it may be used by another thread from now on
+        with self._lock:
+            self._connections.discard(conn)
+
+    def add_response(self, response):
+        # For sessions on other adapters: only their response can be reached
+        with self._lock:
+            self._responses.append(response)
+
+    def kill(self):
+        with self._lock:
+            connections = list(self._connections)
+            # (no connection once the response has released it)
+            for response in self._responses:
+                connections.append(getattr(response.raw, "connection", None))
+            for conn in connections:
+                sock = getattr(conn, "sock", None)
+                if sock is not None:
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
 
 
-requests.Response.apparent_encoding = ForceCchardet.apparent_encoding  # type: ignore
+class _KillableHTTPConnectionPool(HTTPConnectionPool):
+    # Registers the connections it hands out to the kill switch of the current thread
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        switch = getattr(_KILL_SWITCHES, "current", None)
+        if switch is not None:
+            switch.add_connection(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        switch = getattr(_KILL_SWITCHES, "current", None)
+        if switch is not None:
+            switch.discard_connection(conn)
+        super()._put_conn(conn)
+
+
+class _KillableHTTPSConnectionPool(_KillableHTTPConnectionPool, HTTPSConnectionPool):
+    pass
+
+
+_KILLABLE_POOL_CLASSES = {
+    "http": _KillableHTTPConnectionPool,
+    "https": _KillableHTTPSConnectionPool,
+}
+
+
+class _KillableHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._use_killable_pools(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        self._use_killable_pools(manager)
+        return manager
+
+    @staticmethod
+    def _use_killable_pools(manager):
+        # Only in place of urllib3's default pools (not SOCKS proxies' ones)
+        if manager.pool_classes_by_scheme is poolmanager.pool_classes_by_scheme:
+            manager.pool_classes_by_scheme = _KILLABLE_POOL_CLASSES
+
+
+# Enable connection reuse by sharing one connection pool across all fetchers
+# Thanks https://laike9m.com/blog/requests-secret-pool_connections-and-pool_maxsize,89/
+#
+# By default, it will keep connections to 10 hosts (pool_connections=10):
+#   class requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=0, pool_block=False)
+#
+# pool_maxsize is raised so that fetchers running in parallel threads do not
+# discard each other's connections to the same host.
+#
+# Only the adapter (which holds the pool) is shared: each fetcher still has its
+# own session, so that cookies set by responses do not leak from one to another.
+_POOL_CONNECTIONS = 10
+_POOL_MAXSIZE = 32
+
+_ADAPTER = _KillableHTTPAdapter(
+    pool_connections=_POOL_CONNECTIONS, pool_maxsize=_POOL_MAXSIZE
+)
+
+
+def _reset_adapter():
+    # In a forked child, the pooled connections are the parent's sockets: start
+    # over with empty pools (the old ones are dropped, not closed, as closing them
+    # could disturb the parent)
+    _ADAPTER.init_poolmanager(_POOL_CONNECTIONS, _POOL_MAXSIZE)
+    _ADAPTER.proxy_manager = {}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_adapter)
+
+
+def _new_session() -> requests.sessions.Session:
+    session = requests.Session()
+    for prefix in ("http://", "https://"):
+        session.mount(prefix, _ADAPTER)
+    return session
+
+
+# Arguments of requests.Request, as opposed to the ones of Session.send
+# From https://github.com/psf/requests/blob/428f7a275914f60a8f1e76a7d69516d617433d30/requests/models.py#L254
+_PREPARE_KEYS = frozenset(
+    {
+        "method",
+        "url",
+        "headers",
+        "files",
+        "data",
+        "json",
+        "params",
+        "auth",
+        "cookies",
+        "hooks",
+    }
+)
 
 
 class ApiFetcher(object):
@@ -35,25 +266,26 @@ class ApiFetcher(object):
     logger: logging.Logger
     s: requests.sessions.Session
 
+    # Types of the underlying HTTP library (see HttpxApiFetcher for another one)
+    response_class: Type = requests.Response
+    transport_errors: Tuple[Type[Exception], ...] = (
+        requests.exceptions.RequestException,
+    )
+    http_status_error: Type[Exception] = requests.exceptions.HTTPError
+
     def __init__(
         self,
         strategy: RequestStrategy,
         log: RawLogger,
+        session: Optional[requests.sessions.Session] = None,
     ):
         self.strategy = strategy
         self.log = log
         self.logger = logging.getLogger(__name__)
 
-        # Enable connection reuse by sharing the session
-        # Thanks https://laike9m.com/blog/requests-secret-pool_connections-and-pool_maxsize,89/
-        #
-        # By default, it will keep connections to 10 hosts (pool_connections=10):
-        #   class requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=0, pool_block=False)
-        #
-        # Otherwise, you could explicitly tweak the parameters, e.g. like that:
-        #  self.s.mount('http://', HTTPAdapter(pool_connections=100, pool_maxsize=1))
-        #  self.s.mount('https://', HTTPAdapter(pool_connections=100, pool_maxsize=1))
-        self.s = requests.Session()
+        # Use a session on the shared connection pool unless a dedicated one is
+        # provided (e.g. with a differently sized connection pool)
+        self.s = session if session is not None else _new_session()
 
     def get(self, url, **kwargs):
         return self.request_url("get", url, **kwargs)
@@ -63,98 +295,61 @@ class ApiFetcher(object):
 
     def request_url(self, method, url, pre=None, **kwargs):
 
+        # Work that does not change from one try to the next
+        method = method.upper()
+
+        # Replicating defaults from https://github.com/psf/requests/blob/master/requests/api.py
+        if method == "GET" or method == "OPTIONS":
+            kwargs.setdefault("allow_redirects", True)
+        elif method == "HEAD":
+            kwargs.setdefault("allow_redirects", False)
+
+        # The request is only prepared once: retries re-send the same one
+        prepped, kwargs = self._prepare_request(method, url, **kwargs)
+
+        # Read the strategy once, rather than on every try
+        strategy = self.strategy
+        max_tries = strategy.tries
+        code_flags = strategy.code_flags
+        budget = RetryBudget(strategy)
+
         tries = 0
-        start_ts = time.perf_counter()
-        while tries < self.strategy.tries:
+        while tries < max_tries:
+            budget.tick()
 
-            # Exponential backoff sleep (need to explicitly skip it the first time, as otherwise x^0 = 1)
             if tries > 0:
-                to_sleep = (
-                    self.strategy.backoff_mul * self.strategy.backoff_exp ** tries
-                )
-                # Quick check to ensure we won't already be timed out when finished sleeping
-                if (
-                    self.strategy.total_time
-                    and self.strategy.total_time
-                    - (time.perf_counter() - start_ts)
-                    - to_sleep
-                    <= 0
-                ):
-                    raise RequestFailure(
-                        "Total timeout of {} seconds would get reached after exponential backoff".format(
-                            self.strategy.total_time
-                        )
-                    )
+                to_sleep = budget.backoff_delay(tries)
                 self.logger.debug(
-                    "Try #{} failed, sleeping {} seconds before retry.".format(
-                        tries, to_sleep
-                    )
+                    "Try #%d failed, sleeping %s seconds before retry.", tries, to_sleep
                 )
                 time.sleep(to_sleep)
+                budget.tick()
 
             tries += 1
             try:
-                new_kill_timeout = self.strategy.kill_timeout_s
-                if self.strategy.total_time:
-                    max_time_left = self.strategy.total_time - (
-                        time.perf_counter() - start_ts
-                    )
-                    if max_time_left <= 0:
-                        raise RequestFailure(
-                            "Total timeout of {} seconds reached".format(
-                                self.strategy.total_time
-                            )
-                        )
-                    # set a kill timeout as the min between the explicit kill timeout (if any) and max time left (if any)
-                    new_kill_timeout = math.ceil(
-                        min(max_time_left, self.strategy.kill_timeout_s)
-                    )
+                new_kill_timeout = budget.kill_timeout()
 
-                # Apply rate limiter (if any). Note that in the case of a "shared" rate limiter, it's not guaranteed to be OK even after "retry after"
-                # TODO: it should be "retry after", not "go ahead after"
-                if self.strategy.rate_limiter is not None:
-                    res = self.strategy.rate_limiter.is_rejected()
-                    if res[0] is True:
-                        # We have to wait (retry after res[1] seconds)
-                        # Quick check to ensure we won't already be timed out when finished sleeping
-                        if (
-                            self.strategy.total_time
-                            and self.strategy.total_time
-                            - (time.perf_counter() - start_ts)
-                            - res[1]
-                            <= 0
-                        ):
-                            raise RequestFailure(
-                                "Total timeout of {} seconds would get reached after rate limiter Retry-After value of {}".format(
-                                    self.strategy.total_time, res[1]
-                                )
-                            )
-                        self.logger.debug(
-                            "Rate limiting, sleeping {} seconds before retry.".format(
-                                res[1]
-                            )
-                        )
-                        time.sleep(
-                            res[1] + 50 / 1000
-                        )  # Add 50ms of padding: TODO should be externalized, 50ms can be huge in some contexts
+                delay = budget.rate_limit_delay()
+                if delay:
+                    self.logger.debug(
+                        "Rate limiting, sleeping %s seconds before retry.", delay
+                    )
+                    time.sleep(delay + RATE_LIMIT_PADDING_S)
 
-                self.logger.debug(
-                    "Try #{} (of {} maximum)".format(tries, self.strategy.tries)
-                )
+                self.logger.debug("Try #%d (of %d maximum)", tries, max_tries)
                 r = self._request_url_once(
-                    method,
-                    url,
-                    self.strategy,
+                    prepped,
+                    strategy,
                     self.log,
                     self.s,
                     self.logger,
                     pre,
                     override_kill_timeout=new_kill_timeout,
-                    **kwargs
+                    **kwargs,
                 )
             except RequestFailure:
                 raise  # Game over, no time left
-            except (RequestTimeout, requests.exceptions.RequestException) as e:
+            except (RequestTimeout, *self.transport_errors) as e:
                 self.logger.debug(
                     "Request exception (%s): %s", type(e).__name__, str(e)
                 )
@@ -162,31 +357,26 @@ class ApiFetcher(object):
                 # Could also be a override_kill_timeout reached --> it will get intercepted when re-entering the loop
                 continue  # retry
 
-            if not isinstance(r, requests.Response) or not r.status_code:
+            if not isinstance(r, self.response_class) or not r.status_code:
                 # TODO: log the case, as it is weird
-                self.logger.info(
-                    "Response has unexpected type {}".format(type(r).__name__)
-                )
+                self.logger.info("Response has unexpected type %s", type(r).__name__)
                 continue  # retry
 
             # If we are here, we have a response, but it could be an HTTP error (500, etc.)
             # 2 special cases:
             # * normal codes: codes in the 400..599 range that actually mean a success
             # * fatal codes: codes that should not be re-tried
+            status_code = r.status_code
             if (
-                r.status_code >= 400
-                and r.status_code < 600
-                and str(r.status_code) not in self.strategy.normal_codes
+                status_code >= 400
+                and status_code < 600
+                and not code_flags[status_code] & RequestStrategy.FLAG_NORMAL
             ):  # in the error range
-                if (
-                    str(r.status_code) in self.strategy.fatal_codes
-                    or str(r.status_code)[0:2] + "x" in self.strategy.fatal_codes
-                    or str(r.status_code)[0:1] + "xx" in self.strategy.fatal_codes
-                ):
+                if code_flags[status_code] & RequestStrategy.FLAG_FATAL:
                     # Fatal, do not retry
                     try:
                         r.raise_for_status()
-                    except requests.exceptions.HTTPError as e:
+                    except self.http_status_error as e:
                         # We raise our own error so that clients don't need to require the "requests" package directly
                         raise RequestsHTTPError from e
                 else:
@@ -196,108 +386,133 @@ class ApiFetcher(object):
             return r
 
         # If we end up here, it means we reached the maximum number of tries
-        raise RequestFailure(
-            "Request failed (total: {} tries)".format(self.strategy.tries)
+        raise RequestFailure(f"Request failed (total: {max_tries} tries)")
+
+    def _prepare_request(self, method, url, params=None, **kwargs):
+        # In the query string, avoid spaces becoming "+" (want "%20" instead)
+        # (see https://bugs.python.org/issue13866 for more context)
+        # Note: a single urlencode is also cheaper than letting requests encode a
+        # dict itself. A query string that is already encoded is passed as is.
+        if params:
+            kwargs["params"] = (
+                params
+                if isinstance(params, str)
+                else urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
+            )
+
+        # We will use a prepared request, to be able to log the raw request even if
+        # we do not get a response (e.g. hard timeout or exception)
+
+        # We need to split kwargs in 2, one for the prepared request, the rest for sending
+        # (single pass over the known keys that are present, nothing to do without kwargs)
+        kwargs_req = (
+            {k: kwargs.pop(k) for k in _PREPARE_KEYS.intersection(kwargs)}
+            if kwargs
+            else {}
         )
 
+        req = requests.Request(method, url, **kwargs_req)
+        return self.s.prepare_request(req), kwargs
+
     @staticmethod
     def _request_url_once(  # allow to override the kill timeout (to fit in max total time)
-        method,
-        url,
+        prepped: requests.PreparedRequest,
         strategy: RequestStrategy,
         log: RawLogger,
         s: requests.sessions.Session,
         logger,
         pre=None,
         override_kill_timeout=None,
-        params=None,
-        **kwargs
+        **kwargs,
     ):
-        is_logged = log is not None
-
-        # In the query string, avoid spaces becoming "+" (want "%20" instead)
-        # (see https://bugs.python.org/issue13866 for more context)
-        if params:
-            quote_callable = urllib.parse.quote
-            kwargs["params"] = urllib.parse.urlencode(params, quote_via=quote_callable)  # type: ignore
-
-        # Replicating defaults from https://github.com/psf/requests/blob/master/requests/api.py
-        if method == "get" or method == "options":
-            kwargs.setdefault("allow_redirects", True)
-        elif method == "head":
-            kwargs.setdefault("allow_redirects", False)
-
-        kwargs["timeout"] = (
-            strategy.connect_timeout_s,
-            strategy.read_timeout_s,
-        )
-
-        # We will use a prepared request, to be able to log the raw request even if
-        # we do not get a response (e.g. hard timeout or exception)
-
-        # We need to split kwargs in 2, one for the prepared request, the rest for sending
-        kwargs_req = {}
-        for k, v in kwargs.items():
-            # From https://github.com/psf/requests/blob/428f7a275914f60a8f1e76a7d69516d617433d30/requests/models.py#L254
-            if k in [
-                "method",
-                "url",
-                "headers",
-                "files",
-                "data",
-                "json",
-                "params",
-                "auth",
-                "cookies",
-                "hooks",
-            ]:
-                kwargs_req.update({k: v})
-        for k, v in kwargs_req.items():
-            kwargs.pop(k, None)
-
-        req = requests.Request(method.upper(), url, **kwargs_req)
-        prepped = s.prepare_request(req)
+        is_logged = log is not None and log.sample()
 
         # This is the opportunity to alter the request (e.g. for injecting auth)
+        # It is applied to a copy, as the prepared request is re-sent on retries
         if pre:
+            prepped = prepped.copy()
             pre(prepped)
 
-        timed_out = True
         r = None
         kill_timeout = (
             override_kill_timeout
             if override_kill_timeout is not None
             else strategy.kill_timeout_s
         )
-        try:
-            with SignalTimeout(kill_timeout):
-                if is_logged:
-                    timer = Timer()
-                    timer.start()
 
-                r = s.send(prepped, **kwargs)
+        # No single wait may outlast the kill timeout (with a session on another
+        # adapter, this is what bounds the wait for the response headers)
+        kwargs["timeout"] = (
+            cap_timeout(strategy.connect_timeout_s, kill_timeout),
+            cap_timeout(strategy.read_timeout_s, kill_timeout),
+        )
+
+        # Hard timeout on the total time: the response is sent in streaming mode,
+        # and the body is downloaded while a watchdog thread is armed. If it
+        # fires, it shuts the sockets of the try down (see _KillSwitch), which
+        # aborts the wait for the headers or the download (closing the response
+        # would not do: it waits for the pending read to complete).
+        stream = kwargs.pop("stream", False)
+        switch = _KillSwitch()
+        watchdog = ThreadTimeout(kill_timeout, switch.kill)
 
-                # If we arrive here, it means we didn't reach the timeout.
-                # We have to flag this fact explicitly
-                timed_out = False
+        try:
+            if is_logged:
+                timer = Timer()
+                timer.start()
 
-            if timed_out and r is None:
-                raise RequestTimeout("Killed on timeout ({}s)".format(kill_timeout))
+            _KILL_SWITCHES.current = switch
+            try:
+                with watchdog:
+                    r = s.send(prepped, stream=True, **kwargs)
+                    switch.add_response(r)
+                    if not stream and not watchdog.fired.is_set():
+                        r.content  # downloads the body, which gets cached on the response
+            except Exception as e:
+                if watchdog.fired.is_set():
+                    if r is not None:
+                        r.close()
+                    raise RequestTimeout(
+                        f"Killed on timeout ({round(kill_timeout, 3)}s)"
+                    ) from e
+                raise
+            finally:
+                _KILL_SWITCHES.current = None
+
+            if watchdog.fired.is_set():
+                if r is not None:
+                    r.close()
+                raise RequestTimeout(f"Killed on timeout ({round(kill_timeout, 3)}s)")
+
+            if not stream and r.encoding is None:
+                setattr(
+                    r,
+                    ForceCharsetNormalizer.FUTURE_ATTR,
+                    (
+                        os.getpid(),
+                        _encoding_pool().submit(
+                            ForceCharsetNormalizer.detect_encoding, r
+                        ),
+                    ),
+                )
 
         except Exception as e:
             # If we are here, it means the request failed (no response), we log the request
             if is_logged:
                 timer.stop()
-                log.dump_failed(request=prepped, exception=e, timing=timer)
-                logfile = log.to_gz_file()
-                logger.debug("Raw trace at {}".format(logfile))
+                log.dump_in_background(
+                    request=prepped, exception=e, timing=timer, logger=logger
+                )
             raise
 
         if is_logged:
             timer.stop()
-            log.dump(response=r, timing=timer)
-            logfile = log.to_gz_file()
-            logger.debug("Raw trace at {}".format(logfile))
+            if stream:
+                # The trace holds the body: it has to be read here, before the
+                # response is handed over to the caller (the writer thread only
+                # gets a response with its body cached)
+                r.content
+            log.dump_in_background(response=r, timing=timer, logger=logger)
 
         return r
 
@@ -342,8 +557,9 @@ class PaginatedFetcher(FetcherGeneratorInterface, ProcessingFetcherMixin):
         strategy: RequestStrategy,
         log: RawLogger,
         pager: PaginatorInterface,
+        session: Optional[requests.sessions.Session] = None,
     ):
-        self.fetcher = ApiFetcher(strategy, log)
+        self.fetcher = ApiFetcher(strategy, log, session)
         self.pager = pager
 
     def fetch_url(self, method, url, **kwargs):  # generator function
@@ -368,8 +584,9 @@ class Fetcher(FetcherGeneratorInterface, ProcessingFetcherMixin):
         self,
         strategy: RequestStrategy,
         log: RawLogger,
+        session: Optional[requests.sessions.Session] = None,
     ):
-        self.fetcher = ApiFetcher(strategy, log)
+        self.fetcher = ApiFetcher(strategy, log, session)
 
     def fetch_url(self, method, url, **kwargs):  # generator function
 
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+from typing import Optional, Type, Union
+
+import httpx
+
+from .exceptions import RequestFailure, RequestsHTTPError, RequestTimeout
+from .httpx_fetcher import prepare_httpx_request
+from .pagination import PageUrlsPaginatorInterface, PaginatorInterface
+from .request import RATE_LIMIT_PADDING_S, RequestStrategy, RetryBudget
+from .response import AbstractProcessor
+
+
+class AsyncApiFetcher(object):
+    # Same retry / backoff / timeout logic as ApiFetcher, on top of httpx and
+    # asyncio, so that several requests can be in flight at the same time.
+    # Raw trace logging (RawLogger) is not supported, as it relies on the
+    # internals of requests' responses.
+
+    strategy: RequestStrategy
+    logger: logging.Logger
+    client: httpx.AsyncClient
+
+    def __init__(
+        self,
+        strategy: RequestStrategy,
+        client: Optional[httpx.AsyncClient] = None,
+        max_connections: int = 10,
+    ):
+        self.strategy = strategy
+        self.logger = logging.getLogger(__name__)
+
+        # Connections are reused across requests, like with requests' sessions
+        self.client = (
+            client
+            if client is not None
+            else httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections))
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def get(self, url, **kwargs):
+        return await self.request_url("get", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request_url("post", url, **kwargs)
+
+    async def request_url(self, method, url, pre=None, **kwargs):
+
+        # Work that does not change from one try to the next
+        method = method.upper()
+
+        # The request is only built once: retries re-send the same one
+        request, kwargs = prepare_httpx_request(
+            self.client, self.strategy, method, url, **kwargs
+        )
+
+        # Read the strategy once, rather than on every try
+        # (same retry logic as ApiFetcher.request_url, sleeping asynchronously)
+        strategy = self.strategy
+        max_tries = strategy.tries
+        code_flags = strategy.code_flags
+        budget = RetryBudget(strategy)
+
+        tries = 0
+        while tries < max_tries:
+            budget.tick()
+
+            if tries > 0:
+                to_sleep = budget.backoff_delay(tries)
+                self.logger.debug(
+                    "Try #%d failed, sleeping %s seconds before retry.", tries, to_sleep
+                )
+                await asyncio.sleep(to_sleep)
+                budget.tick()
+
+            tries += 1
+            try:
+                new_kill_timeout = budget.kill_timeout()
+
+                delay = budget.rate_limit_delay()
+                if delay:
+                    self.logger.debug(
+                        "Rate limiting, sleeping %s seconds before retry.", delay
+                    )
+                    await asyncio.sleep(delay + RATE_LIMIT_PADDING_S)
+
+                self.logger.debug("Try #%d (of %d maximum)", tries, max_tries)
+                r = await self._request_url_once(
+                    request,
+                    strategy,
+                    self.client,
+                    pre,
+                    override_kill_timeout=new_kill_timeout,
+                    **kwargs,
+                )
+            except RequestFailure:
+                raise  # Game over, no time left
+            except (RequestTimeout, httpx.TransportError) as e:
+                self.logger.debug(
+                    "Request exception (%s): %s", type(e).__name__, str(e)
+                )
+                # Low level error, e.g. connection error, socket error, etc. --> retryable
+                continue  # retry
+
+            # If we are here, we have a response, but it could be an HTTP error (500, etc.)
+            # (see ApiFetcher.request_url for the "normal" and "fatal" codes)
+            status_code = r.status_code
+            if (
+                status_code >= 400
+                and status_code < 600
+                and not code_flags[status_code] & RequestStrategy.FLAG_NORMAL
+            ):  # in the error range
+                if code_flags[status_code] & RequestStrategy.FLAG_FATAL:
+                    # Fatal, do not retry
+                    try:
+                        r.raise_for_status()
+                    except httpx.HTTPStatusError as e:
+                        raise RequestsHTTPError(str(e)) from e
+                else:
+                    continue  # retry
+
+            # Success: we return the response for further processing
+            return r
+
+        # If we end up here, it means we reached the maximum number of tries
+        raise RequestFailure(f"Request failed (total: {max_tries} tries)")
+
+    @staticmethod
+    async def _request_url_once(  # allow to override the kill timeout (to fit in max total time)
+        request: httpx.Request,
+        strategy: RequestStrategy,
+        client: httpx.AsyncClient,
+        pre=None,
+        override_kill_timeout=None,
+        **kwargs,
+    ):
+        # This is the opportunity to alter the request (e.g. for injecting auth)
+        # It is applied to a copy, as the request is re-sent on retries
+        if pre:
+            request = httpx.Request(
+                request.method,
+                request.url,
+                headers=request.headers,
+                stream=request.stream,
+                extensions=request.extensions,
+            )
+            pre(request)
+
+        kill_timeout = (
+            override_kill_timeout
+            if override_kill_timeout is not None
+            else strategy.kill_timeout_s
+        )
+        try:
+            # The body is downloaded by send(), so the kill timeout covers it
+            return await asyncio.wait_for(
+                client.send(request, **kwargs), kill_timeout or None
+            )
+        except asyncio.TimeoutError as e:
+            raise RequestTimeout(
+                f"Killed on timeout ({round(kill_timeout, 3)}s)"
+            ) from e
+
+
+class AsyncPaginatedFetcher(object):
+
+    fetcher: AsyncApiFetcher
+    pager: Union[PaginatorInterface, PageUrlsPaginatorInterface]
+    concurrency: int
+
+    def __init__(
+        self,
+        strategy: RequestStrategy,
+        pager: Union[PaginatorInterface, PageUrlsPaginatorInterface],
+        client: Optional[httpx.AsyncClient] = None,
+        concurrency: int = 10,
+    ):
+        self.fetcher = AsyncApiFetcher(strategy, client, max_connections=concurrency)
+        self.pager = pager
+        self.concurrency = concurrency
+
+    async def aclose(self):
+        await self.fetcher.aclose()
+
+    def get(self, url, **kwargs):
+        return self.fetch_url("get", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.fetch_url("post", url, **kwargs)
+
+    async def fetch_url(self, method, url, **kwargs):  # async generator function
+
+        if isinstance(self.pager, PageUrlsPaginatorInterface):
+            # All pages are known upfront: fetch them concurrently
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def fetch_one(page_url):
+                async with semaphore:
+                    return await self.fetcher.request_url(method, page_url, **kwargs)
+
+            results = await asyncio.gather(
+                *(fetch_one(page_url) for page_url in self.pager.page_urls(url)),
+                return_exceptions=True,
+            )
+            for res in results:
+                if isinstance(res, BaseException):
+                    raise res
+                yield res
+            return
+
+        # Otherwise, the next page is only known once the previous one is fetched
+        self.pager.reset()
+
+        kwargs["method"] = method
+        kwargs["url"] = url
+
+        while self.pager.has_more():
+            self.pager.alter_request_params(kwargs)  # mutates kwargs directly
+            res = await self.fetcher.request_url(**kwargs)
+            self.pager.inspect_response(res)
+            yield res
+
+    async def fetch_and_process_url(
+        self, method, url, payload_processor_class: Type[AbstractProcessor], **kwargs
+    ):
+        # instanciate the payload processor
+        processor = (payload_processor_class)()
+
+        async for r in self.fetch_url(method=method, url=url, **kwargs):
+            # Process the payload
+            processor.process_one_response(r)
+
+        return processor.return_all_data()
@@ -0,0 +1,146 @@
+import logging
+import time
+import urllib.parse
+from typing import Optional
+
+import httpx
+
+from .apifetch import ApiFetcher
+from .exceptions import RequestTimeout
+from .request import RequestStrategy, cap_timeout
+
+# Arguments of httpx's send(), as opposed to the ones of build_request
+_SEND_KEYS = frozenset({"auth", "follow_redirects", "stream"})
+
+
+def prepare_httpx_request(client, strategy: RequestStrategy, method, url, **kwargs):
+    # Shared by HttpxApiFetcher and AsyncApiFetcher: builds the request (once,
+    # retries re-send the same one) and returns it with the arguments of send().
+    # The method is expected in upper case.
+    params = kwargs.pop("params", None)
+    # In the query string, avoid spaces becoming "+" (want "%20" instead).
+    # httpx would re-encode them as "+", so we build the query string ourselves.
+    # A query string that is already encoded is passed as is.
+    if params:
+        url = "{}{}{}".format(
+            url,
+            "&" if "?" in url else "?",
+            params
+            if isinstance(params, str)
+            else urllib.parse.urlencode(params, quote_via=urllib.parse.quote),
+        )
+
+    # Keep the same keyword and defaults as requests (httpx does not follow
+    # redirects by default): follow them, except for HEAD requests
+    # (cf https://github.com/psf/requests/blob/master/requests/api.py)
+    kwargs["follow_redirects"] = kwargs.pop("allow_redirects", method != "HEAD")
+
+    kwargs["timeout"] = httpx_timeout(strategy)
+
+    # We need to split kwargs in 2, one for building the request, the rest for sending
+    # (single pass over the known keys that are present)
+    kwargs_send = {k: kwargs.pop(k) for k in _SEND_KEYS.intersection(kwargs)}
+
+    return client.build_request(method, url, **kwargs), kwargs_send
+
+
+def httpx_timeout(strategy: RequestStrategy, kill_timeout=None) -> httpx.Timeout:
+    return httpx.Timeout(
+        cap_timeout(strategy.read_timeout_s, kill_timeout),
+        connect=cap_timeout(strategy.connect_timeout_s, kill_timeout),
+    )
+
+
+class HttpxApiFetcher(ApiFetcher):
+    # Same as ApiFetcher, on top of an httpx client with HTTP/2 enabled, so that
+    # requests to the same host get multiplexed over a single connection.
+    # HTTP/2 requires the "h2" package (pip install httpx[http2]).
+    # Raw trace logging (RawLogger) is not supported, as it relies on the
+    # internals of requests' responses.
+
+    s: httpx.Client  # type: ignore
+
+    response_class = httpx.Response
+    transport_errors = (httpx.TransportError,)
+    http_status_error = httpx.HTTPStatusError
+
+    def __init__(
+        self,
+        strategy: RequestStrategy,
+        client: Optional[httpx.Client] = None,
+    ):
+        self.strategy = strategy
+        self.log = None  # type: ignore
+        self.logger = logging.getLogger(__name__)
+
+        self.s = (
+            client
+            if client is not None
+            else httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            )
+        )
+
+    def close(self):
+        self.s.close()
+
+    def _prepare_request(self, method, url, **kwargs):
+        return prepare_httpx_request(self.s, self.strategy, method, url, **kwargs)
+
+    @staticmethod
+    def _request_url_once(  # allow to override the kill timeout (to fit in max total time)
+        prepped,  # httpx.Request
+        strategy: RequestStrategy,
+        log,
+        s,  # httpx.Client
+        logger,
+        pre=None,
+        override_kill_timeout=None,
+        stream=False,
+        **kwargs,
+    ):
+        # This is the opportunity to alter the request (e.g. for injecting auth)
+        # It is applied to a copy, as the request is re-sent on retries
+        request = prepped
+        if pre:
+            request = httpx.Request(
+                request.method,
+                request.url,
+                headers=request.headers,
+                stream=request.stream,
+                extensions=request.extensions,
+            )
+            pre(request)
+
+        kill_timeout = (
+            override_kill_timeout
+            if override_kill_timeout is not None
+            else strategy.kill_timeout_s
+        )
+        # (set on the request, which is only used by one try at a time)
+        request.extensions["timeout"] = httpx_timeout(strategy, kill_timeout).as_dict()
+        deadline = time.perf_counter() + kill_timeout if kill_timeout else None
+
+        r = s.send(request, stream=True, **kwargs)
+        if stream:
+            return r
+
+        # Hard timeout on the total time: the deadline is checked between chunks,
+        # the wait for each chunk being bounded by the read timeout.
+        # (shutting the socket down from another thread, as ApiFetcher does,
+        # would kill all the other requests multiplexed on the same connection)
+        chunks = []
+        try:
+            for chunk in r.iter_bytes():
+                chunks.append(chunk)
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise RequestTimeout(
+                        f"Killed on timeout ({round(kill_timeout, 3)}s)"
+                    )
+        finally:
+            r.close()
+        # Same as what httpx.Response.read() does
+        r._content = b"".join(chunks)
+
+        return r
@@ -2,42 +2,114 @@
 # Copyright 2014 Ian Cordasco, Cory Benfield
 # Licensed under the Apache License, Version 2.0
 
+import atexit
 import base64
+import functools
 import gzip
 import json
+import logging
 import os
+import queue
+import random
 import secrets
+import threading
 import time
 from datetime import datetime
-from typing import Callable, List
+from typing import Callable, List, Optional
 
 from requests import compat
 
+from .utils import is_text_content_type
+
 
 class Timer(object):
+    # Only the raw clock values are read while the request is in flight, the
+    # dates get formatted when the trace is written (in a background thread)
+
+    __slots__ = ("_start_ts", "_start_time", "_end_time", "total_time_s")
+
     def start(self):
         self._start_ts = time.perf_counter()
-        self.start_date = datetime.utcnow().isoformat() + "Z"
+        self._start_time = time.time()
 
     def stop(self):
-        self.end_date = datetime.utcnow().isoformat() + "Z"
+        self._end_time = time.time()
         self.total_time_s = time.perf_counter() - self._start_ts
 
+    @property
+    def start_date(self):
+        return datetime.utcfromtimestamp(self._start_time).isoformat() + "Z"
+
+    @property
+    def end_date(self):
+        return datetime.utcfromtimestamp(self._end_time).isoformat() + "Z"
+
+
+# The same client usually sends the same credentials over and over: remember the
+# masked values instead of decoding them again for every trace
+@functools.lru_cache(maxsize=128)
+def _mask_authorization_value(value):
+    cval = None
+    parts = value.split(" ", 1)
+    if len(parts) == 2:
+        type = parts[0].lower()
+        if type == "basic":
+            try:
+                basic = base64.b64decode(parts[1]).decode().split(":", 1)
+            except Exception:
+                basic = ("?",)
+            cval = "{} <<masked password, username={}>>".format(parts[0], basic[0])
+        elif type == "bearer":
+            jwt = parts[1].split(".")
+            if (
+                len(jwt) == 3
+            ):  # We can be fairly confident it's a JWT, we remove the signature
+                try:
+                    # Thanks https://gist.github.com/perrygeo/ee7c65bb1541ff6ac770 for the tip about padding (risk this exception otherwise: binascii.Error: Incorrect padding)
+                    header = base64.urlsafe_b64decode(jwt[0] + "===").decode()
+                    body = base64.urlsafe_b64decode(jwt[1] + "===").decode()
+                    jwtout = (
+                        header,
+                        body,
+                    )
+                except Exception:
+                    jwtout = (
+                        "?",
+                        "?",
+                    )
+                cval = "{} <<masked JWT, header={}, body={}>>".format(
+                    parts[0], jwtout[0], jwtout[1]
+                )
+            else:  # Other kind of token
+                cval = "{} <<masked opaque token>>".format(parts[0])
+        else:
+            cval = "{} <<masked>>".format(parts[0])
+
+    return value if cval is None else cval
+
 
 class HeaderFilter(object):
     # TODO: cookie
 
+    # Each function of the stack is called as fn(name, name_lower, value) and
+    # returns a (name, value) tuple. The header name is lowercased once by the
+    # caller, rather than once per function.
+
+    __slots__ = ("stack",)
+
     stack: List[Callable]
 
     def __init__(self):
         self.stack = []
 
     def mask_by_name(self, header_name, show_first_chars=None):
-        def fn(name, value, header_name=header_name):
+        target = header_name.lower()
+
+        def fn(name, name_lower, value):
             return (
                 name,
                 value
-                if name.lower() != header_name.lower()
+                if name_lower != target
                 else (
                     "<<masked>>"
                     if show_first_chars is None
@@ -50,51 +122,15 @@ class HeaderFilter(object):
         return self
 
     def mask_authorization(self):
-        def fn(name, value):
-            cval = None
-            if name.lower() == "authorization":
-                parts = value.split(" ", 1)
-                if len(parts) == 2:
-                    type = parts[0].lower()
-                    if type == "basic":
-                        try:
-                            basic = base64.b64decode(parts[1]).decode().split(":", 1)
-                        except Exception:
-                            basic = ("?",)
-                        cval = "{} <<masked password, username={}>>".format(
-                            parts[0], basic[0]
-                        )
-                    elif type == "bearer":
-                        jwt = parts[1].split(".")
-                        if (
-                            len(jwt) == 3
-                        ):  # We can be fairly confident it's a JWT, we remove the signature
-                            try:
-                                # Thanks https://gist.github.com/perrygeo/ee7c65bb1541ff6ac770 for the tip about padding (risk this exception otherwise: binascii.Error: Incorrect padding)
-                                header = base64.urlsafe_b64decode(
-                                    jwt[0] + "==="
-                                ).decode()
-                                body = base64.urlsafe_b64decode(jwt[1] + "===").decode()
-                                jwtout = (
-                                    header,
-                                    body,
-                                )
-                            except Exception:
-                                jwtout = (
-                                    "?",
-                                    "?",
-                                )
-                            cval = "{} <<masked JWT, header={}, body={}>>".format(
-                                parts[0], jwtout[0], jwtout[1]
-                            )
-                        else:  # Other kind of token
-                            cval = "{} <<masked opaque token>>".format(parts[0])
-                    else:
-                        cval = "{} <<masked>>".format(parts[0])
-
+        def fn(name, name_lower, value):
+            if name_lower == "authorization":
+                return (
+                    name,
+                    _mask_authorization_value(value),
+                )
             return (
                 name,
-                value if cval is None else cval,
+                value,
             )
 
         self.stack.append(fn)
@@ -107,37 +143,162 @@ class BodyFilter(object):
     pass
 
 
+class _LogQueue(object):
+    # Raw traces are serialized and written to disk by a single background thread
+    # (same idea as logging's QueueHandler / QueueListener), so that this I/O does
+    # not sit between the moment a response is received and the moment it is
+    # returned to the caller.
+    # The RawLogger instances are only ever used from this thread, which also
+    # makes it safe to share one between fetchers running in parallel threads.
+    # The thread is started by the first trace queued, and again in a forked child
+    # (threads are not carried over by fork).
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        # (in a forked child, the traces still queued are left to the parent)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        # Number of queued traces per RawLogger (by id), guarded by the condition
+        self._pending = {}
+        self._cond = threading.Condition()
+
+    def put(
+        self, log, response=None, request=None, exception=None, timing=None, logger=None
+    ):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="apifetch-rawlog", daemon=True
+                )
+                self._thread.start()
+            key = id(log)
+            self._pending[key] = self._pending.get(key, 0) + 1
+        self._queue.put((log, response, request, exception, timing, logger))
+
+    def flush(self, log=None):
+        # Wait for the queued traces of the given RawLogger (or all of them) to be
+        # written
+        with self._cond:
+            if log is None:
+                self._cond.wait_for(lambda: not self._pending)
+            else:
+                key = id(log)
+                self._cond.wait_for(lambda: key not in self._pending)
+
+    def _run(self):
+        while True:
+            log, response, request, exception, timing, logger = self._queue.get()
+            try:
+                if response is not None:
+                    log.dump(response=response, timing=timing)
+                else:
+                    log.dump_failed(request=request, exception=exception, timing=timing)
+                logfile = log.to_gz_file()
+                if logger is not None:
+                    logger.debug("Raw trace at %s", logfile)
+            except Exception:
+                logging.getLogger(__name__).exception("Failed to write raw trace")
+            finally:
+                with self._cond:
+                    key = id(log)
+                    if self._pending[key] > 1:
+                        self._pending[key] -= 1
+                    else:
+                        del self._pending[key]
+                    self._cond.notify_all()
+
+
+_LOG_QUEUE = _LogQueue()
+# Do not lose the pending traces when the interpreter exits
+atexit.register(_LOG_QUEUE.flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_LOG_QUEUE._reset)
+
+
+# Let's convert the version int from httplib to bytes
+_HTTP_VERSIONS = {
+    9: b"0.9",
+    10: b"1.0",
+    11: b"1.1",
+}
+
+# Status codes, as written in the status line
+_STATUS_BYTES = {code: str(code).encode("ascii") for code in range(100, 600)}
+
+# Placeholders for the bodies that are not logged
+_NON_STRING_BODY = b"<< Request body is not a string-like type >>"
+_BINARY_BODY = b"<< Binary response body >>"
+
+# Response bodies from this size on are not copied into the trace buffer
+_INLINE_BODY_MAX_SIZE = 64 * 1024
+
+
+def _coerce_to_bytes(data):
+    # Dispatch on the exact type first: nearly all values are str or bytes
+    data_type = type(data)
+    if data_type is str:
+        return data.encode("utf-8")
+    if data_type is bytes:
+        return data
+    # Don't bail out with an exception if data is None
+    if data is None:
+        return b""
+    if not isinstance(data, bytes) and hasattr(data, "encode"):
+        return data.encode("utf-8")
+    return data
+
+
 class RawLogger(object):
 
+    __slots__ = (
+        "path",
+        "request_header_filter",
+        "response_header_filter",
+        "response_body_filter",
+        "sampling",
+        "segments",
+        "boundary",
+        "boundary_bytes",
+        "counter",
+    )
+
     path: str
 
-    request_header_filter = None
-    response_header_filter = None
-    response_body_filter = None
+    request_header_filter: Optional[HeaderFilter]
+    response_header_filter: Optional[HeaderFilter]
+    response_body_filter: Optional[BodyFilter]
 
-    sampling = 1
-    bytearr: bytearray
+    sampling: int
+    # The trace is kept as a list of bytes objects, written out one after the
+    # other: each dump is joined into a single segment (there is no buffer to
+    # grow, so no resize copies), and large bodies are kept there by reference
+    segments: List[bytes]
     boundary: str
+    boundary_bytes: bytes
 
     counter: int
 
-    save_func = None
-
     def reset(self):
-        self.bytearr = bytearray()
         self.boundary = "rawtrace.{}.{}".format(int(time.time()), secrets.token_hex(16))
+        # Encoded once, as it is written for every part
+        self.boundary_bytes = self.boundary.encode("ascii")
 
-        self.bytearr.extend(
-            self.coerce_to_bytes(
-                'Content-Type: multipart/mixed; boundary="{}"\n\n'.format(self.boundary)
-            )
-        )
+        self.segments = [
+            b'Content-Type: multipart/mixed; boundary="'
+            + self.boundary_bytes
+            + b'"\n\n'
+        ]
 
         self.counter = 0
 
     def __init__(self, path: str, sampling: int = 1):
-        self.sampling = sampling  # TODO: use the sampling
+        self.sampling = sampling  # log one request out of "sampling"
         self.path = path
+        self.request_header_filter = None
+        self.response_header_filter = None
+        self.response_body_filter = None
 
         self.reset()
 
@@ -145,9 +306,8 @@ class RawLogger(object):
         filename = self.boundary
         filepath = os.path.join(self.path, filename)
         self._write_closing_boundary()
-        f = open(filepath, "wb")
-        f.write(self.bytearr)
-        f.close()
+        with open(filepath, "wb") as f:
+            f.writelines(self.segments)
         self.reset()
         return filename
 
@@ -160,13 +320,27 @@ class RawLogger(object):
         # the content. If you want to produce a complete gzip-compatible binary string,
         # with the header etc, use gzip.GzipFile
         self._write_closing_boundary()
-        f = open(filepath, "wb")
-        with gzip.GzipFile(fileobj=f, mode="w") as fgz:
-            fgz.write(self.bytearr)
-        f.close()
+        with open(filepath, "wb") as f, gzip.GzipFile(fileobj=f, mode="w") as fgz:
+            fgz.writelines(self.segments)
         self.reset()
         return filename
 
+    def sample(self) -> bool:
+        # Whether to log the next request: decided before sending it, so that the
+        # requests that are not sampled pay nothing for the trace
+        return self.sampling <= 1 or random.random() * self.sampling < 1
+
+    def dump_in_background(
+        self, response=None, request=None, exception=None, timing=None, logger=None
+    ):
+        # Same as dump (or dump_failed when there is no response) followed by
+        # to_gz_file, done later by a background thread
+        _LOG_QUEUE.put(self, response, request, exception, timing, logger)
+
+    def close(self):
+        # Wait for the traces this logger dumped in background to be written
+        _LOG_QUEUE.flush(self)
+
     def with_request_header_filter(self, header_filter: HeaderFilter):
         self.request_header_filter = header_filter
         return self
@@ -179,6 +353,11 @@ class RawLogger(object):
         self.response_body_filter = body_filter
         return self
 
+    @property
+    def bytearr(self) -> bytearray:
+        # The trace so far, as a single buffer
+        return bytearray(b"".join(self.segments))
+
     def dump_failed(
         self,
         request,
@@ -186,23 +365,27 @@ class RawLogger(object):
         exception: Exception = None,
         timing: Timer = None,
     ):
+        # Each dump is first assembled as a list of bytes, and appended to the
+        # trace in one go
+        parts: List[bytes] = []
         self._dump_request_data(
+            parts,
             request,
             proxy_info=None,
         )
-        self._write_boundary("response")
-        self.bytearr.extend(
-            b"<< "
-            + self.coerce_to_bytes(
+        self._write_boundary(parts, "response")
+        parts.append(b"<< ")
+        parts.append(
+            _coerce_to_bytes(
                 'Exception "{}": {}'.format(type(exception).__name__, str(exception))
                 if exception is not None
                 else reason
             )
-            + b" >>"
-            + b"\n"
         )
+        parts.append(b" >>\n")
         if timing:
-            self._dump_timer(timing)
+            self._dump_timer(parts, timing)
+        self.segments.append(b"".join(parts))
 
     def dump(self, response, timing: Timer = None):
         """Dump all requests and responses including redirects.
@@ -212,65 +395,60 @@ class RawLogger(object):
         final request-response.
         """
 
-        history = list(response.history[:])
-        history.append(response)
-
-        for response in history:
+        parts: List[bytes] = []
+        for previous in response.history:
             self._dump_one(
-                response,
+                parts,
+                previous,
             )
+        self._dump_one(parts, response)
         if timing:
-            self._dump_timer(timing)
+            self._dump_timer(parts, timing)
+        self.segments.append(b"".join(parts))
 
-    def _write_boundary(self, x_type: str, content_type: str = None):
+    def _write_boundary(
+        self, parts: List[bytes], x_type: str, content_type: str = None
+    ):
         self.counter += 1
-        lines = []
-        lines.append("--{}".format(self.boundary))
-        lines.append("X-Type: {}".format(x_type))
-        lines.append(
-            "Content-Type: {}".format(
-                content_type if content_type else "text/plain; charset=utf-8"
-            )
-        )
-        lines.append(
-            'Content-Disposition: inline; filename="{}"'.format(
-                self.boundary
-                + "."
-                + str(self.counter).rjust(4, "0")
-                + "."
-                + x_type
-                + ".log"
+        boundary = self.boundary_bytes
+        x_type_bytes = x_type.encode("ascii")
+        parts.extend(
+            (
+                b"--",
+                boundary,
+                b"\nX-Type: ",
+                x_type_bytes,
+                b"\nContent-Type: ",
+                content_type.encode("utf-8")
+                if content_type
+                else b"text/plain; charset=utf-8",
+                b'\nContent-Disposition: inline; filename="',
+                boundary,
+                b".",
+                str(self.counter).rjust(4, "0").encode("ascii"),
+                b".",
+                x_type_bytes,
+                b'.log"\n\n',
             )
         )
 
-        self.bytearr.extend(
-            self.coerce_to_bytes("\n".join(lines)) + b"\n"
-        )  # because "join" will not add a trailing LF
-        self.bytearr.extend(b"\n")
-
     def _write_closing_boundary(self):
-        self.bytearr.extend(self.coerce_to_bytes("--{}--\n".format(self.boundary)))
+        self.segments.append(b"--" + self.boundary_bytes + b"--\n")
 
-    def _write_headers(self, headers, header_filter=None):
+    def _write_headers(self, parts: List[bytes], headers, header_filter=None):
+        # Called for every header: bind what is used in the loop to locals
+        coerce = _coerce_to_bytes
+        append = parts.append
+        stack = header_filter.stack if header_filter is not None else ()
         for name, value in headers.items():
-            if header_filter is not None:
-                mname = name
-                mvalue = value
-                for mask in header_filter.stack:
-                    mname, mvalue = mask(mname, mvalue)
-                self.bytearr.extend(
-                    self.coerce_to_bytes(mname)
-                    + b": "
-                    + self.coerce_to_bytes(mvalue)
-                    + b"\r\n"
-                )
-            else:
-                self.bytearr.extend(
-                    self.coerce_to_bytes(name)
-                    + b": "
-                    + self.coerce_to_bytes(value)
-                    + b"\r\n"
-                )
+            if stack:
+                name_lower = name.lower()
+                for mask in stack:
+                    name, value = mask(name, name_lower, value)
+            append(coerce(name))
+            append(b": ")
+            append(coerce(value))
+            append(b"\r\n")
 
     @classmethod
     def get_proxy_information(cls, response):
@@ -289,91 +467,95 @@ class RawLogger(object):
         uri = compat.urlparse(url)
         proxy_url = proxy_info.get("request_path")
         if proxy_url is not None:
-            request_path = cls.coerce_to_bytes(proxy_url)
+            request_path = _coerce_to_bytes(proxy_url)
             return request_path, uri
 
-        request_path = cls.coerce_to_bytes(uri.path)
+        request_path = _coerce_to_bytes(uri.path)
         if uri.query:
-            request_path += b"?" + cls.coerce_to_bytes(uri.query)
+            request_path += b"?" + _coerce_to_bytes(uri.query)
 
         return request_path, uri
 
-    @classmethod
-    def coerce_to_bytes(cls, data):
-        if not isinstance(data, bytes) and hasattr(data, "encode"):
-            data = data.encode("utf-8")
-        # Don't bail out with an exception if data is None
-        return data if data is not None else b""
+    coerce_to_bytes = staticmethod(_coerce_to_bytes)
 
-    def _dump_request_data(self, request, proxy_info=None):
+    def _dump_request_data(self, parts: List[bytes], request, proxy_info=None):
         if proxy_info is None:
             proxy_info = {}
 
-        method = self.coerce_to_bytes(proxy_info.pop("method", request.method))
+        coerce = _coerce_to_bytes
+        method = coerce(proxy_info.pop("method", request.method))
         request_path, uri = self.build_request_path(request.url, proxy_info)
 
-        self._write_boundary("request")
+        self._write_boundary(parts, "request")
         # <prefix><METHOD> <request-path> HTTP/1.1
-        self.bytearr.extend(method + b" " + request_path + b" HTTP/1.1\r\n")
-
         # <prefix>Host: <request-host> OR host header specified by user
         headers = request.headers.copy()
-        host_header = self.coerce_to_bytes(headers.pop("Host", uri.netloc))
-        self.bytearr.extend(b"Host: " + host_header + b"\r\n")
+        host_header = coerce(headers.pop("Host", uri.netloc))
+        parts.append(
+            b"%b %b HTTP/1.1\r\nHost: %b\r\n" % (method, request_path, host_header)
+        )
 
         # rest of HTTP headers
-        self._write_headers(headers, self.request_header_filter)
-        self.bytearr.extend(b"\r\n")
+        self._write_headers(parts, headers, self.request_header_filter)
+        parts.append(b"\r\n")
 
         if request.body:
             if isinstance(request.body, compat.basestring):
-                self.bytearr.extend(self.coerce_to_bytes(request.body))
+                parts.append(coerce(request.body))
             else:
                 # In the event that the body is a file-like object, let's not try
                 # to read everything into memory.
-                self.bytearr.extend(b"<< Request body is not a string-like type >>")
-        self.bytearr.extend(b"\n")
+                parts.append(_NON_STRING_BODY)
+        parts.append(b"\n")
 
-    def _dump_response_data(self, response):
+    def _dump_response_data(self, parts: List[bytes], response):
         # Let's interact almost entirely with urllib3's response
         raw = response.raw
+        coerce = _coerce_to_bytes
 
-        # Let's convert the version int from httplib to bytes
-        HTTP_VERSIONS = {
-            9: b"0.9",
-            10: b"1.0",
-            11: b"1.1",
-        }
-        version_str = HTTP_VERSIONS.get(raw.version, b"?")
+        version_str = _HTTP_VERSIONS.get(raw.version, b"?")
 
-        self._write_boundary("response")
+        self._write_boundary(parts, "response")
         # <prefix>HTTP/<version_str> <status_code> <reason>
-        self.bytearr.extend(
-            b"HTTP/"
-            + version_str
-            + b" "
-            + str(raw.status).encode("ascii")
-            + b" "
-            + self.coerce_to_bytes(response.reason)
-            + b"\r\n"
+        parts.append(
+            b"HTTP/%b %b %b\r\n"
+            % (
+                version_str,
+                _STATUS_BYTES.get(raw.status) or str(raw.status).encode("ascii"),
+                coerce(response.reason),
+            )
         )
 
-        self._write_headers(raw.headers, self.response_header_filter)
-        self.bytearr.extend(b"\r\n")
+        self._write_headers(parts, raw.headers, self.response_header_filter)
+        parts.append(b"\r\n")
 
         # Avoid logging binary body
+        # Charset detection (apparent_encoding) is the last resort: it is not
+        # needed when the encoding is known, or when the content type is text
         if (
             len(response.content) > 0
             and response.encoding is None
+            and not is_text_content_type(response.headers.get("content-type"))
             and response.apparent_encoding is None
         ):
-            self.bytearr.extend(b"<< Binary response body >>")
+            parts.append(_BINARY_BODY)
         else:
             # TODO: body filter
-            self.bytearr.extend(response.content)
-        self.bytearr.extend(b"\n")
-
-    def _dump_one(self, response):
+            self._write_body(parts, response.content)
+        parts.append(b"\n")
+
+    def _write_body(self, parts: List[bytes], body: bytes):
+        if len(body) < _INLINE_BODY_MAX_SIZE:
+            parts.append(body)
+            return
+        # A large body is not copied into the buffer: it is already held by the
+        # response, so the trace just keeps a reference to it, and it is only
+        # copied when the trace gets written to disk
+        self.segments.append(b"".join(parts))
+        parts.clear()
+        self.segments.append(body)
+
+    def _dump_one(self, parts: List[bytes], response):
         """Dump a single request-response cycle's information.
 
         This will take a response object and dump only the data that requests can
@@ -386,16 +568,18 @@ class RawLogger(object):
 
         proxy_info = self.get_proxy_information(response)
         self._dump_request_data(
+            parts,
             response.request,
             proxy_info=proxy_info,
         )
-        self._dump_response_data(response)
+        self._dump_response_data(parts, response)
 
-    def _dump_timer(self, timing: Timer):
-        self._write_boundary("timing-hint", "application/json")
+    def _dump_timer(self, parts: List[bytes], timing: Timer):
+        self._write_boundary(parts, "timing-hint", "application/json")
         data = {
             "sentAt": timing.start_date,
             "receivedAt": timing.end_date,
             "totalTime": timing.total_time_s,
         }
-        self.bytearr.extend(self.coerce_to_bytes(json.dumps(data)) + b"\n")
+        parts.append(_coerce_to_bytes(json.dumps(data)))
+        parts.append(b"\n")
@@ -1,5 +1,7 @@
 import abc
-from urllib.parse import parse_qs, urlparse
+import re
+from typing import List
+from urllib.parse import quote
 
 from requests.models import Response
 
@@ -7,6 +9,8 @@ from .response import get_header_links
 
 
 class PaginatorInterface(metaclass=abc.ABCMeta):
+    __slots__ = ()
+
     @abc.abstractmethod
     def reset(self):
         pass
@@ -25,19 +29,41 @@ class PaginatorInterface(metaclass=abc.ABCMeta):
         pass
 
 
+class PageUrlsPaginatorInterface(metaclass=abc.ABCMeta):
+    # For APIs where the URLs of all pages can be computed upfront (e.g. the total
+    # number of pages is known), which allows fetching them concurrently
+    @abc.abstractmethod
+    def page_urls(self, url: str) -> List[str]:
+        pass
+
+
 class LinkPaginator(PaginatorInterface):
     # Assumptions:
     # * page is passed as a query string argument
     # * next page is extracted from the Link (rel=next) header
 
+    __slots__ = (
+        "define_page_size",
+        "page_size_attr",
+        "page_size",
+        "page_num_start",
+        "page_num_attr",
+        "page_num",
+        "page_num_re",
+        "nb_dl",
+        "keep_going",
+    )
+
     # If page size is configurable
-    define_page_size: bool = False
+    define_page_size: bool
     page_size_attr: str
     page_size: int
 
     page_num_start: int
     page_num_attr: str
     page_num: int
+    # Extracts the value(s) of page_num_attr from a URL
+    page_num_re: re.Pattern
 
     # TODO: sanity check / limit of calls for pagination
     nb_dl: int
@@ -57,12 +83,17 @@ class LinkPaginator(PaginatorInterface):
             raise Exception(
                 "page_size_attr and page_size need to be both defined or both None"
             )
-        if page_size is not None and page_size_attr is not None:
-            self.define_page_size = True
-            self.page_size = page_size
-            self.page_size_attr = page_size_attr
+        self.define_page_size = page_size is not None and page_size_attr is not None
+        self.page_size = page_size
+        self.page_size_attr = page_size_attr
         self.page_num_attr = page_num_attr
         self.page_num_start = page_num_start
+        # Compiled once, rather than parsing the whole URL and query string of
+        # every next link. The name can also appear percent-encoded (e.g. page[number]).
+        names = {re.escape(page_num_attr), re.escape(quote(page_num_attr, safe=""))}
+        self.page_num_re = re.compile(
+            r"[?&](?:{})=([^&#]+)".format("|".join(sorted(names)))
+        )
         self.reset()
 
     def reset(self):
@@ -89,21 +120,20 @@ class LinkPaginator(PaginatorInterface):
         next_link = get_header_links(res, rel="next")
         has_more = False
         if next_link:
-            u = urlparse(next_link)
-            # "query" will be an empty string if no query string args
-            q = parse_qs(u.query)
-            # note that values are always returned as lists, e.g. {'page': ['1'], 'size': ['50']}
+            # note that the argument could be repeated, in which case we do not know which page is next
+            values = self.page_num_re.findall(next_link)
 
-            if self.page_num_attr in q and len(q[self.page_num_attr]) == 1:
-                if int(q[self.page_num_attr][0]) <= self.page_num:
+            if len(values) == 1:
+                next_page_num = int(values[0])
+                if next_page_num <= self.page_num:
                     raise Exception(
                         'Found a link for next page={} (extracted from "{}"), but it is less or equal to the current page={}'.format(
-                            q[self.page_num_attr][0],
+                            values[0],
                             res.headers.get("link"),
                             self.page_num,
                         )
                     )
-                self.page_num = int(q[self.page_num_attr][0])
+                self.page_num = next_page_num
                 has_more = True
         self.keep_going = has_more
 
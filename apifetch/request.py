@@ -1,18 +1,44 @@
-import abc
-import signal
+import re
+import threading
 import time
-from typing import List, Tuple
+from typing import Callable, FrozenSet, List, Optional, Tuple
 
+from .exceptions import RequestFailure
 from .resilience import RateLimiterInterface
 
+# Status code patterns accepted for normal and fatal codes: "404", "40x" or "4xx"
+# (4xx and 5xx only)
+_CODE_PATTERN_RE = re.compile(r"[45](?:[0-9]{2}|[0-9]x|xx)")
+
 
 class RequestStrategy(object):
 
-    tries = 1
-    total_time = None
+    # Fixed set of attributes: no per-instance __dict__, and the defaults are
+    # set in __init__ rather than on the class
+    __slots__ = (
+        "tries",
+        "total_time",
+        "normal_codes",
+        "fatal_codes",
+        "normal_code_set",
+        "fatal_code_set",
+        "code_flags",
+        "backoff_exp",
+        "backoff_mul",
+        "_backoff_table",
+        "_backoff_key",
+        "rate_limiter",
+        "connect_timeout_s",
+        "read_timeout_s",
+        "kill_timeout_s",
+    )
+
+    tries: int
+    total_time: Optional[float]
 
     # In case you need to consider some code(s) between 400 and 599 as
     # "normal" (e.g. for API calls returning empty response as 404)
+    # Same patterns as below.
     normal_codes: List[str]
 
     # In case some codes should not be retried (e.g. a 401 or 403 is
@@ -20,21 +46,43 @@ class RequestStrategy(object):
     # "DDx" and "Dxx" patterns (e.g. "4xx", "40x") are acceptable.
     fatal_codes: List[str]
 
-    backoff_exp = 2
-    backoff_mul = 0.5  # with exponent 2, gives: 1, 2, 4, 8, 16, etc.
+    # Both lists above expanded into the status codes they match
+    normal_code_set: FrozenSet[int]
+    fatal_code_set: FrozenSet[int]
+
+    # And compiled into one flag per status code (0..599), so that classifying a
+    # response is a single lookup
+    FLAG_FATAL = 1
+    FLAG_NORMAL = 2
+    code_flags: bytes
+
+    backoff_exp: int
+    backoff_mul: float
+    # Sleep time before each try (see backoff_table)
+    _backoff_table: Tuple[float, ...]
+    _backoff_key: Optional[Tuple[int, float, int]]
 
-    rate_limiter = None
+    rate_limiter: Optional[RateLimiterInterface]
 
-    connect_timeout_s = 0.0
-    read_timeout_s = 0.0
-    kill_timeout_s = 0
+    connect_timeout_s: float
+    read_timeout_s: float
+    kill_timeout_s: float  # 0 means no kill timeout
 
-    def __init__(self, connect_timeout: float, read_timeout: float, kill_timeout: int):
+    def __init__(
+        self, connect_timeout: float, read_timeout: float, kill_timeout: float
+    ):
+        self.tries = 1
+        self.total_time = None
+        self.backoff_exp = 2
+        self.backoff_mul = 0.5  # with exponent 2, gives: 1, 2, 4, 8, 16, etc.
+        self.rate_limiter = None
         self.connect_timeout_s = connect_timeout
         self.read_timeout_s = read_timeout
         self.kill_timeout_s = kill_timeout
         self.normal_codes = []
         self.fatal_codes = []
+        self._update_code_flags()
+        self._backoff_key = None
 
     def connect_timeout(self, connect_timeout: float):
         self.connect_timeout_s = connect_timeout
@@ -44,7 +92,7 @@ class RequestStrategy(object):
         self.read_timeout_s = read_timeout
         return self
 
-    def kill_timeout(self, kill_timeout: int):
+    def kill_timeout(self, kill_timeout: float):
         self.kill_timeout_s = kill_timeout
         return self
 
@@ -57,19 +105,53 @@ class RequestStrategy(object):
         return self
 
     def normal_response_codes(self, response_codes: list):
-        for code in response_codes:
-            if not isinstance(code, str) or int(code) < 400 or int(code) >= 600:
-                raise Exception('Invalid option "{}"'.format(code))
+        self._check_code_patterns(response_codes)
         self.normal_codes = response_codes
+        self._update_code_flags()
         return self
 
     def fatal_response_codes(self, response_codes: list):
-        for code in response_codes:
-            if not isinstance(code, str) or (code[0:1] != "4" and code[0:1] != "5"):
-                raise Exception('Invalid option "{}"'.format(code))
+        self._check_code_patterns(response_codes)
         self.fatal_codes = response_codes
+        self._update_code_flags()
         return self
 
+    @staticmethod
+    def _check_code_patterns(response_codes: list):
+        for code in response_codes:
+            if not isinstance(code, str) or not _CODE_PATTERN_RE.fullmatch(code):
+                raise Exception('Invalid option "{}"'.format(code))
+
+    @staticmethod
+    def _expand_code_pattern(pattern: str) -> range:
+        # "404" -> 404, "40x" -> 400..409, "4xx" -> 400..499
+        if len(pattern) == 3:
+            if pattern.isdigit():
+                return range(int(pattern), int(pattern) + 1)
+            if pattern[2] == "x" and pattern[:2].isdigit():
+                return range(int(pattern[:2]) * 10, int(pattern[:2]) * 10 + 10)
+            if pattern[1:] == "xx" and pattern[0].isdigit():
+                return range(int(pattern[0]) * 100, int(pattern[0]) * 100 + 100)
+        return range(0)
+
+    def _update_code_flags(self):
+        self.normal_code_set = frozenset(
+            c
+            for pattern in self.normal_codes
+            for c in self._expand_code_pattern(pattern)
+        )
+        self.fatal_code_set = frozenset(
+            c
+            for pattern in self.fatal_codes
+            for c in self._expand_code_pattern(pattern)
+        )
+        flags = bytearray(600)
+        for c in self.normal_code_set:
+            flags[c] |= self.FLAG_NORMAL
+        for c in self.fatal_code_set:
+            flags[c] |= self.FLAG_FATAL
+        self.code_flags = bytes(flags)
+
     def backoff_multiplier(self, multiplier: float):
         self.backoff_mul = multiplier
         return self
@@ -78,28 +160,132 @@ class RequestStrategy(object):
         self.backoff_exp = exponent
         return self
 
+    @property
+    def backoff_table(self) -> Tuple[float, ...]:
+        # Sleep time before each try (index 0 is never used), computed on first
+        # use and again only if tries or the backoff settings changed since
+        key = (self.tries, self.backoff_mul, self.backoff_exp)
+        if key != self._backoff_key:
+            self._backoff_table = tuple(
+                self.backoff_mul * self.backoff_exp ** i for i in range(self.tries + 1)
+            )
+            self._backoff_key = key
+        return self._backoff_table
+
     def rate_limit(self, limiter: RateLimiterInterface):
         self.rate_limiter = limiter
         return self
 
 
-class SignalTimeout:
-    # Thanks to https://stackoverflow.com/a/22156618/8046487
+# Added to the delays given by rate limiters
+# TODO: should be externalized, 50ms can be huge in some contexts
+RATE_LIMIT_PADDING_S = 50 / 1000
 
-    class SignalTimeoutException(Exception):
-        pass
 
-    @staticmethod
-    def _timeout(signum, frame):
-        raise SignalTimeout.SignalTimeoutException()
+def cap_timeout(timeout, kill_timeout):
+    # No single wait may outlast the kill timeout of the try
+    if not kill_timeout:
+        return timeout
+    return kill_timeout if timeout is None or timeout > kill_timeout else timeout
+
+
+class RetryBudget(object):
+    # Timing decisions of the retry loop (backoff, total time, kill timeout, rate
+    # limiting), shared by the fetchers: they only differ in how they sleep and send.
+    # The strategy is read once, rather than on every try.
+
+    __slots__ = (
+        "total_time",
+        "kill_timeout_s",
+        "backoff_table",
+        "rate_limiter",
+        "start_ts",
+        "elapsed",
+    )
+
+    def __init__(self, strategy: RequestStrategy):
+        self.total_time = strategy.total_time
+        self.kill_timeout_s = strategy.kill_timeout_s
+        self.backoff_table = strategy.backoff_table
+        self.rate_limiter = strategy.rate_limiter
+        self.start_ts = time.perf_counter()
+        self.elapsed = 0.0
+
+    def tick(self):
+        # Read the clock once per try (and again after sleeping)
+        self.elapsed = time.perf_counter() - self.start_ts
+
+    def backoff_delay(self, tries: int) -> float:
+        # Exponential backoff sleep before try #tries+1 (never called before the
+        # first one, as otherwise x^0 = 1)
+        to_sleep = self.backoff_table[tries]
+        # Quick check to ensure we won't already be timed out when finished sleeping
+        if self.total_time and self.total_time - self.elapsed - to_sleep <= 0:
+            raise RequestFailure(
+                f"Total timeout of {self.total_time} seconds would get reached after exponential backoff"
+            )
+        return to_sleep
 
-    def __init__(self, timeout: int = 10):
+    def kill_timeout(self) -> float:
+        kill_timeout = self.kill_timeout_s
+        if not self.total_time:
+            return kill_timeout
+        max_time_left = self.total_time - self.elapsed
+        if max_time_left <= 0:
+            raise RequestFailure(f"Total timeout of {self.total_time} seconds reached")
+        # set a kill timeout as the min between the explicit kill timeout (if any) and max time left (if any)
+        # (no need to round it, the kill timeout is not limited to whole seconds)
+        return (
+            max_time_left
+            if not kill_timeout or max_time_left < kill_timeout
+            else kill_timeout
+        )
+
+    def rate_limit_delay(self) -> float:
+        # Apply rate limiter (if any). Note that in the case of a "shared" rate limiter, it's not guaranteed to be OK even after "retry after"
+        # TODO: it should be "retry after", not "go ahead after"
+        if self.rate_limiter is None:
+            return 0
+        res = self.rate_limiter.is_rejected()
+        if res[0] is not True:
+            return 0
+        # We have to wait (retry after res[1] seconds)
+        # Quick check to ensure we won't already be timed out when finished sleeping
+        if self.total_time and self.total_time - self.elapsed - res[1] <= 0:
+            raise RequestFailure(
+                f"Total timeout of {self.total_time} seconds would get reached after rate limiter Retry-After value of {res[1]}"
+            )
+        return res[1]
+
+
+class ThreadTimeout:
+    # Replaces a SIGALRM-based timeout (thanks to https://stackoverflow.com/a/22156618/8046487):
+    # signal handlers are process-wide, they can only be installed from the main
+    # thread, and alarm() only takes whole seconds.
+    # Instead, a timer thread calls on_timeout if the block is still running after
+    # "timeout" seconds (0 disables it). on_timeout cannot raise in the blocked
+    # thread, it has to make the pending operation fail (e.g. shut its socket down).
+
+    __slots__ = ("timeout", "on_timeout", "fired", "_timer")
+
+    def __init__(self, timeout: float, on_timeout: Callable[[], None]):
         self.timeout = timeout
-        signal.signal(signal.SIGALRM, SignalTimeout._timeout)
+        self.on_timeout = on_timeout
+        self.fired = threading.Event()
+        self._timer = None
+
+    def _fire(self):
+        self.fired.set()
+        self.on_timeout()
 
     def __enter__(self):
-        signal.alarm(self.timeout)
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        signal.alarm(0)
-        return exc_type is SignalTimeout.SignalTimeoutException
+        if self._timer is not None:
+            self._timer.cancel()
+        return False
@@ -1,6 +1,7 @@
 import abc
+import threading
 import time
-from typing import List, Tuple
+from typing import Tuple
 
 from requests.models import Request, Response
 
@@ -63,6 +64,8 @@ class CircuitBreakerInterface(metaclass=abc.ABCMeta):
 
 
 class RateLimiterInterface(metaclass=abc.ABCMeta):
+    __slots__ = ()
+
     @classmethod
     def __subclasshook__(cls, subclass):
         return (
@@ -81,15 +84,12 @@ class RateLimiterInterface(metaclass=abc.ABCMeta):
 class LocalGCRA(RateLimiterInterface):
     # Derived from https://github.com/rwz/redis-gcra/blob/master/vendor/perform_gcra_ratelimit.lua
     #
-    # Especially for "rebasing" the time to a more recent epoch, to preserve precision:
-    #
-    # "redis returns time as an array containing two integers: seconds of the epoch
-    # time (10 digits) and microseconds (6 digits). for convenience we need to
-    # convert them to a floating point number. the resulting number is 16 digits,
-    # bordering on the limits of a 64-bit double-precision floating point number.
-    # adjust the epoch to be relative to Jan 1, 2017 00:00:00 GMT to avoid floating
-    # point problems. this approach is good until "now" is 2,483,228,799 (Wed, 09
-    # Sep 2048 01:46:39 GMT), when the adjusted value is 16 digits."
+    # The Lua version "rebases" the epoch time to preserve float precision. Being
+    # local, we can use the monotonic clock instead: its values are small, and it
+    # is not affected by adjustments of the system clock (which would either let
+    # requests through or block them for a long time).
+
+    __slots__ = ("limit", "emission_interval", "_lock")
 
     limit: float
     emission_interval: float
@@ -100,30 +100,33 @@ class LocalGCRA(RateLimiterInterface):
 
         self.limit = None
         self.emission_interval = emission_interval
+        # The limiter can be shared by fetchers running in parallel threads: the
+        # read-modify-write of self.limit must not interleave, otherwise two
+        # threads could both be let through for the same slot
+        self._lock = threading.Lock()
 
     def is_rejected(self) -> Tuple[bool, float]:
 
-        ts = time.time()
-        jan_1_2020 = 1577836800
-        now = ts - jan_1_2020
-
-        tat = self.limit
-        if tat is None:
-            tat = now
-
-        allow_at = max(tat, now)
-        new_tat = allow_at + self.emission_interval
-
-        diff = now - allow_at
-
-        if diff < 0:
-            return (
-                True,
-                round(-1 * diff, 2),
-            )
-        else:
-            self.limit = new_tat
-            return (
-                False,
-                -1,
-            )
+        with self._lock:
+            now = time.monotonic()
+
+            tat = self.limit
+            if tat is None:
+                tat = now
+
+            allow_at = max(tat, now)
+            new_tat = allow_at + self.emission_interval
+
+            diff = now - allow_at
+
+            if diff < 0:
+                return (
+                    True,
+                    -diff,
+                )
+            else:
+                self.limit = new_tat
+                return (
+                    False,
+                    -1,
+                )
@@ -1,11 +1,50 @@
 import abc
-import binascii
-from typing import List
+import functools
+import re
+from typing import List, Optional
 
 from requests.models import Response
 from requests.utils import parse_header_links
 
 from .exceptions import InvalidResponse
+from .utils import json_may_contain_latin_mojibake
+
+# Optional faster JSON parser (pip install apifetch[orjson])
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+# Optional faster XML parser (pip install apifetch[lxml])
+try:
+    from lxml import etree
+
+    # Same as ElementTree: no network access, entities are not expanded
+    _XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True)
+except ImportError:
+    from xml.etree import ElementTree as etree
+
+    _XML_PARSER = None
+
+
+# Optional streaming JSON parser (pip install apifetch[ijson])
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# <url>; ...; rel="value" (one match per link, the url and the first rel)
+_LINK_REL_RE = re.compile(r"""<([^<>]*)>[^<]*?;\s*rel\s*=\s*["']?([^"';,]+)""")
+
+# Compared as is (no need to hex-encode the payload)
+_JPEG_SOI = b"\xff\xd8"
+_JPEG_EOI = b"\xff\xd9"
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Digit runs that may be an integer out of orjson's range (-2**63 to 2**64-1), which
+# it would turn into a float (also matches long fractions and digits in strings,
+# which are then merely parsed by the regular path)
+_BIG_INT_RE = re.compile(rb"-\d{19}|\d{20}")
 
 
 class AbstractProcessor(metaclass=abc.ABCMeta):
@@ -22,23 +61,52 @@ class JsonListProcessor(AbstractProcessor):
 
     data: List
 
+    # Path to the entries, in ijson's syntax: "item" for a top-level list,
+    # "data.item" for {"data": [...]}, etc. When set, the entries are parsed
+    # one at a time rather than loading the whole payload (mangle_payload is
+    # not called then). Requests sent with stream=True are parsed while they
+    # are downloaded (the kill timeout does not cover the download then).
+    stream_path: Optional[str] = None
+
+    # Opt-in: scan each payload once as a whole, to tell whether any of its
+    # strings may need fix_latin_mojibake. process_item (then defined as a
+    # regular method) can skip the fix when self.mojibake_suspected is False.
+    # Without the scan, mojibake_suspected stays True.
+    scan_mojibake: bool = False
+
+    mojibake_suspected: bool
+
     def __init__(self):
         self.data = []
+        self.mojibake_suspected = True
 
     def process_one_response(self, res: Response) -> None:
-        # Validate the payload is proper JSON (or raise an InvalidResponse)
-        j = get_json(res)
+        if self.scan_mojibake:
+            self.mojibake_suspected = _json_may_contain_latin_mojibake(
+                res, self.stream_path is not None
+            )
 
-        # Give an opportunity to mangle the whole payload, to expose a list
-        payload = self.mangle_payload(j)
+        if self.stream_path is not None:
+            # Validated along the way (or raises an InvalidResponse)
+            payload = iter_json_items(res, self.stream_path)
+        else:
+            # Validate the payload is proper JSON (or raise an InvalidResponse)
+            j = get_json(res)
 
-        for entry in payload:
-            # Extract what we are interested in
-            unit = self.process_item(entry)
+            # Give an opportunity to mangle the whole payload, to expose a list
+            payload = self.mangle_payload(j)
 
-            if unit is not None:
-                # allows killing bad entries
-                self.data.append(unit)
+        # Extract what we are interested in (None allows killing bad entries)
+        # The loop skips process_item if not overridden. Entries are only added
+        # once the whole payload went through (a streamed one may turn out invalid
+        # after some entries were parsed).
+        if type(self).process_item is JsonListProcessor.process_item:
+            units = [entry for entry in payload if entry is not None]
+        else:
+            units = [
+                unit for unit in map(self.process_item, payload) if unit is not None
+            ]
+        self.data.extend(units)
 
     def return_all_data(self):
         return self.data
@@ -52,7 +120,30 @@ class JsonListProcessor(AbstractProcessor):
         return payload
 
 
+def _json_may_contain_latin_mojibake(r: Response, streamed: bool) -> bool:
+    # Scanned at the bytes level, so only for UTF-8 payloads
+    # (and without reading a body that is going to be parsed while downloaded)
+    if not _is_utf8_json(r) or (streamed and _is_body_pending(r)):
+        return True
+    return json_may_contain_latin_mojibake(r.content)
+
+
 def get_header_links(r: Response, rel=None):  # for REST API pagination
+    if rel is not None:
+        # Fast path for the common case (looking for a given rel, e.g. "next"),
+        # without parsing the whole header
+        link = r.headers.get("link")
+        if not link or rel not in link:
+            return None
+        found = False
+        for m in _LINK_REL_RE.finditer(link):
+            found = True
+            if m.group(2).strip(" '\"") == rel:
+                return m.group(1).strip(" '\"")
+        if found:
+            return None
+        # Unusual syntax: let requests make sense of it
+
     try:
         rels = parse_header_links(r.headers.get("link"))
         if rel is None:
@@ -72,26 +163,98 @@ def get_header_links(r: Response, rel=None):  # for REST API pagination
 def get_jpeg(r: Response):
     # Last 2 bytes must be ffd9
     # https://en.wikipedia.org/wiki/JPEG#Syntax_and_structure
-    lastbytes = binascii.b2a_hex(r.content[-2:])
-    if lastbytes != b"ffd9":
+    buf = r.content
+    if not buf.endswith(_JPEG_EOI):
         raise InvalidResponse(
-            "Payload is not a valid JPEG! Last 2 bytes were: " + str(lastbytes)
+            "Payload is not a valid JPEG! Last 2 bytes were: " + buf[-2:].hex()
         )
-    return r.content
+    return buf
 
 
 def get_png(r: Response):
     # First 8 bytes must be 89 50 4e 47 0d 0a 1a 0a
     # http://www.libpng.org/pub/png/spec/1.2/PNG-Rationale.html#R.PNG-file-signature
-    firstbytes = binascii.b2a_hex(r.content[:8])
-    if firstbytes != b"89504e470d0a1a0a":
+    buf = r.content
+    if not buf.startswith(_PNG_SIGNATURE):
+        raise InvalidResponse(
+            "Payload is not a valid PNG! First 8 bytes were: " + buf[:8].hex()
+        )
+    return buf
+
+
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _read_streamed(r: Response, size: int):
+    # First bytes of the payload, and an iterator on the rest: for a response
+    # requested with stream=True, only those first bytes are downloaded upfront
+    if not _is_body_pending(r):
+        buf = r.content
+        return buf[:size], iter((buf[size:],))
+    return r.raw.read(size, decode_content=True), r.iter_content(_STREAM_CHUNK_SIZE)
+
+
+def _keep_content(r: Response, buf: bytes) -> None:
+    # Kept on the response, as r.content would (the stream cannot be read again)
+    r._content = buf
+    r._content_consumed = True  # type: ignore
+
+
+def get_jpeg_streamed(r: Response):
+    # For a response requested with stream=True. Stricter than get_jpeg, which only
+    # checks the end of image marker (ffd9): a payload that does not start with the
+    # start of image marker (ffd8) is rejected too, before downloading the rest
+    head, rest = _read_streamed(r, len(_JPEG_SOI))
+    if head != _JPEG_SOI:
+        r.close()
+        raise InvalidResponse(
+            "Payload is not a valid JPEG! First 2 bytes were: " + head.hex()
+        )
+    buf = head + b"".join(rest)
+    _keep_content(r, buf)
+    if not buf.endswith(_JPEG_EOI):
+        raise InvalidResponse(
+            "Payload is not a valid JPEG! Last 2 bytes were: " + buf[-2:].hex()
+        )
+    return buf
+
+
+def get_png_streamed(r: Response):
+    # Same as get_png, for a response requested with stream=True: an invalid
+    # payload is rejected after its first 8 bytes, without downloading the rest
+    head, rest = _read_streamed(r, len(_PNG_SIGNATURE))
+    if head != _PNG_SIGNATURE:
+        r.close()
         raise InvalidResponse(
-            "Payload is not a valid PNG! First 8 bytes were: " + str(firstbytes)
+            "Payload is not a valid PNG! First 8 bytes were: " + head.hex()
         )
-    return r.content
+    buf = head + b"".join(rest)
+    _keep_content(r, buf)
+    return buf
+
+
+def _is_utf8_json(r: Response) -> bool:
+    # orjson only reads UTF-8: other charsets are left to requests
+    encoding = r.encoding
+    return encoding is None or encoding.lower().replace("_", "-") in (
+        "utf-8",
+        "utf8",
+    )
 
 
 def get_json(r: Response):
+    # orjson parses the bytes directly (no decoding to str first).
+    # Whatever it rejects (e.g. NaN) goes through the regular path, and so do
+    # payloads that may hold integers out of its range (it would silently return
+    # them as floats), so that the result does not depend on orjson being installed.
+    if orjson is not None and _is_utf8_json(r):
+        content = r.content
+        if _BIG_INT_RE.search(content) is None:
+            try:
+                return orjson.loads(content)
+            except orjson.JSONDecodeError:
+                pass
+
     # This will raise a ValueError exception if not valid JSON
     try:
         return r.json()
@@ -99,11 +262,76 @@ def get_json(r: Response):
         raise InvalidResponse("Payload is not valid JSON! " + str(e))
 
 
+def _is_body_pending(r: Response) -> bool:
+    # Whether the body of a response requested with stream=True is still to be read
+    # (_content_consumed is set by requests, not part of its typed interface)
+    return getattr(r, "raw", None) is not None and not getattr(
+        r, "_content_consumed", True
+    )
+
+
+def iter_json_items(r: Response, path: str):  # generator function
+    if ijson is None:
+        # Same result, but the whole payload gets loaded
+        yield from _walk_json_path(get_json(r), path.split(".") if path else [])
+        return
+
+    # A body that was not downloaded yet is parsed while reading it
+    if _is_body_pending(r):
+        r.raw.decode_content = True
+        source = r.raw
+    else:
+        source = r.content
+
+    try:
+        # (floats as float, like json does, rather than Decimal)
+        yield from ijson.items(source, path, use_float=True)
+    except ijson.JSONError as e:
+        raise InvalidResponse("Payload is not valid JSON! " + str(e))
+
+
+def _walk_json_path(node, keys):  # generator function
+    if not keys:
+        yield node
+        return
+    key = keys[0]
+    if key == "item" and isinstance(node, list):
+        for child in node:
+            yield from _walk_json_path(child, keys[1:])
+    elif isinstance(node, dict) and key in node:
+        yield from _walk_json_path(node[key], keys[1:])
+
+
+@functools.lru_cache(maxsize=16)
+def _lxml_parser_for(charset: str):
+    # Same as _XML_PARSER, decoding the payload as the given charset
+    return etree.XMLParser(encoding=charset, resolve_entities=False, no_network=True)
+
+
+def _declared_charset(r: Response) -> Optional[str]:
+    # Charset given by the Content-Type header, if any (r.encoding may be a default)
+    content_type = r.headers.get("content-type")
+    if content_type:
+        for param in content_type.split(";")[1:]:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "charset":
+                return value.strip(" '\"") or None
+    return None
+
+
 def get_xml(r: Response):
     # This will raise a ParseError exception if not valid XML
-    from xml.etree import ElementTree
-
+    # Parsed from bytes, so that the parser uses the encoding of the XML declaration,
+    # unless the HTTP headers declare a charset (which takes precedence, RFC 7303)
+    charset = _declared_charset(r)
     try:
-        return ElementTree.fromstring(r.text)
+        if charset is None or charset.lower().replace("_", "-") in ("utf-8", "utf8"):
+            parser = _XML_PARSER
+        elif _XML_PARSER is not None:
+            parser = _lxml_parser_for(charset)
+        else:
+            # (ElementTree parsers cannot be reused)
+            parser = etree.XMLParser(encoding=charset)
+        return etree.fromstring(r.content, parser=parser)
     except Exception as e:
         raise InvalidResponse("Payload is not valid XML! " + str(e))
@@ -1,167 +1,289 @@
+import functools
+import re
 import unicodedata
+from typing import Optional
 
 from .jsonc import JSONEncoder
 
+# Built once: the encoder holds no state between calls (safe to share across threads)
+_CANONICAL_ENCODER = JSONEncoder(sort_keys=True)
+
 
 def as_canonical_json_string(d: dict) -> str:
-    return JSONEncoder(sort_keys=True).encode(d)
+    return _CANONICAL_ENCODER.encode(d)
+
+
+class _ControlCharactersTable(dict):
+    # str.translate() table removing all the "C*" characters (control, format,
+    # surrogate, private use, unassigned), and turning tabs and line feeds into
+    # spaces. The category of a character is only looked up the first time it is
+    # seen, the result is kept in the table (for the BMP only, to bound its size).
+    def __missing__(self, codepoint):
+        value = None if unicodedata.category(chr(codepoint))[0] == "C" else codepoint
+        if codepoint <= 0xFFFF:
+            self[codepoint] = value
+        return value
+
+
+_CONTROL_CHARACTERS_TABLE = _ControlCharactersTable({ord("\t"): " ", ord("\n"): " "})
+
+
+# Short strings (names, categories, tags...) tend to come back over and over in
+# API payloads: the results of the functions below are cached for those
+_CACHED_MAX_LENGTH = 256
+_CACHE_SIZE = 8192
 
 
 def remove_control_characters_tabs_breaks(s):
     # Thanks to https://stackoverflow.com/a/19016117/8046487
     # Note that \n, \r and \t are considered as control chars (Cc) and will get trimmed
     # Good riddance for \r, and we pre-process \n and \t to convert them to spaces instead
-    s_notab = s.replace("\t", " ").replace("\n", " ")
-    return "".join(ch for ch in s_notab if unicodedata.category(ch)[0] != "C")
+    if len(s) <= _CACHED_MAX_LENGTH:
+        return _remove_control_characters_tabs_breaks_cached(s)
+    return s.translate(_CONTROL_CHARACTERS_TABLE)
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _remove_control_characters_tabs_breaks_cached(s):
+    return s.translate(_CONTROL_CHARACTERS_TABLE)
+
+
+# List from http://www.i18nqa.com/debug/utf8-debug.html
+_MOJIBAKE_SEQUENCES = [
+    "\xC2\xA0",  # 'NO-BREAK SPACE' (U+00A0)
+    "\xC2\xA1",  # "¡"
+    "\xC2\xA2",  # "¢"
+    "\xC2\xA3",  # "£"
+    "\xC2\xA4",  # "¤"
+    "\xC2\xA5",  # "¥"
+    "\xC2\xA6",  # "¦"
+    "\xC2\xA7",  # "§"
+    "\xC2\xA8",  # "¨"
+    "\xC2\xA9",  # "©"
+    "\xC2\xAA",  # "ª"
+    "\xC2\xAB",  # "«"
+    "\xC2\xAC",  # "¬"
+    "\xC2\xAD",  # 'SOFT HYPHEN' (U+00AD)
+    "\xC2\xAE",  # "®"
+    "\xC2\xAF",  # "¯"
+    "\xC2\xB0",  # "°"
+    "\xC2\xB1",  # "±"
+    "\xC2\xB2",  # "²"
+    "\xC2\xB3",  # "³"
+    "\xC2\xB4",  # "´"
+    "\xC2\xB5",  # "µ"
+    "\xC2\xB6",  # "¶"
+    "\xC2\xB7",  # "·"
+    "\xC2\xB8",  # "¸"
+    "\xC2\xB9",  # "¹"
+    "\xC2\xBA",  # "º"
+    "\xC2\xBB",  # "»"
+    "\xC2\xBC",  # "¼"
+    "\xC2\xBD",  # "½"
+    "\xC2\xBE",  # "¾"
+    "\xC2\xBF",  # "¿"
+    "\xC3\x80",  # "À"
+    "\xC3\x81",  # "Á"
+    "\xC3\x82",  # "Â"
+    "\xC3\x83",  # "Ã"
+    "\xC3\x84",  # "Ä"
+    "\xC3\x85",  # "Å"
+    "\xC3\x86",  # "Æ"
+    "\xC3\x87",  # "Ç"
+    "\xC3\x88",  # "È"
+    "\xC3\x89",  # "É"
+    "\xC3\x8A",  # "Ê"
+    "\xC3\x8B",  # "Ë"
+    "\xC3\x8C",  # "Ì"
+    "\xC3\x8D",  # "Í"
+    "\xC3\x8E",  # "Î"
+    "\xC3\x8F",  # "Ï"
+    "\xC3\x90",  # "Ð"
+    "\xC3\x91",  # "Ñ"
+    "\xC3\x92",  # "Ò"
+    "\xC3\x93",  # "Ó"
+    "\xC3\x94",  # "Ô"
+    "\xC3\x95",  # "Õ"
+    "\xC3\x96",  # "Ö"
+    "\xC3\x97",  # "×"
+    "\xC3\x98",  # "Ø"
+    "\xC3\x99",  # "Ù"
+    "\xC3\x9A",  # "Ú"
+    "\xC3\x9B",  # "Û"
+    "\xC3\x9C",  # "Ü"
+    "\xC3\x9D",  # "Ý"
+    "\xC3\x9E",  # "Þ"
+    "\xC3\x9F",  # "ß"
+    "\xC3\xA0",  # "à"
+    "\xC3\xA1",  # "á"
+    "\xC3\xA2",  # "â"
+    "\xC3\xA3",  # "ã"
+    "\xC3\xA4",  # "ä"
+    "\xC3\xA5",  # "å"
+    "\xC3\xA6",  # "æ"
+    "\xC3\xA7",  # "ç"
+    "\xC3\xA8",  # "è"
+    "\xC3\xA9",  # "é"
+    "\xC3\xAA",  # "ê"
+    "\xC3\xAB",  # "ë"
+    "\xC3\xAC",  # "ì"
+    "\xC3\xAD",  # "í"
+    "\xC3\xAE",  # "î"
+    "\xC3\xAF",  # "ï"
+    "\xC3\xB0",  # "ð"
+    "\xC3\xB1",  # "ñ"
+    "\xC3\xB2",  # "ò"
+    "\xC3\xB3",  # "ó"
+    "\xC3\xB4",  # "ô"
+    "\xC3\xB5",  # "õ"
+    "\xC3\xB6",  # "ö"
+    "\xC3\xB7",  # "÷"
+    "\xC3\xB8",  # "ø"
+    "\xC3\xB9",  # "ù"
+    "\xC3\xBA",  # "ú"
+    "\xC3\xBB",  # "û"
+    "\xC3\xBC",  # "ü"
+    "\xC3\xBD",  # "ý"
+    "\xC3\xBE",  # "þ"
+    "\xC3\xBF",  # "ÿ"
+    "\xC5\x92",  # "Œ"
+    "\xC5\x93",  # "œ"
+    "\xC5\xA0",  # "Š"
+    "\xC5\xA1",  # "š"
+    "\xC5\xB8",  # "Ÿ"
+    "\xC5\xBD",  # "Ž"
+    "\xC5\xBE",  # "ž"
+    "\xC6\x92",  # "ƒ"
+    "\xCB\x86",  # "ˆ"
+    "\xCB\x9C",  # "˜"
+    "\xE2\x80\x93",  # "–"
+    "\xE2\x80\x94",  # "—"
+    "\xE2\x80\x98",  # "‘"
+    "\xE2\x80\x99",  # "’"
+    "\xE2\x80\x9A",  # "‚"
+    "\xE2\x80\x9C",  # "“"
+    "\xE2\x80\x9D",  # "”"
+    "\xE2\x80\x9E",  # "„"
+    "\xE2\x80\xA0",  # "†"
+    "\xE2\x80\xA1",  # "‡"
+    "\xE2\x80\xA2",  # "•"
+    "\xE2\x80\xA6",  # "…"
+    "\xE2\x80\xB0",  # "‰"
+    "\xE2\x80\xB9",  # "‹"
+    "\xE2\x80\xBA",  # "›"
+    "\xE2\x82\xAC",  # "€"
+    "\xE2\x84\xA2",  # "™"
+]
+
+
+def _prefix_tree_pattern(sequences):
+    # "ab|ac|d" -> "(?:a[bc]|d)": the sequences are grouped by their first
+    # character (and so on, recursively), so that the regex engine only tries
+    # the few that can match at a given position, instead of each one in turn
+    groups = {}
+    for seq in sequences:
+        groups.setdefault(seq[0], []).append(seq[1:])
+    ends = "".join(re.escape(first) for first, rests in groups.items() if "" in rests)
+    alternatives = ["[{}]".format(ends)] if ends else []
+    for first, rests in groups.items():
+        rests = [rest for rest in rests if rest]
+        if rests:
+            alternatives.append(re.escape(first) + _prefix_tree_pattern(rests))
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:{})".format("|".join(alternatives))
+
+
+# All the sequences above, looked up in a single pass
+_MOJIBAKE_RE = re.compile(_prefix_tree_pattern(_MOJIBAKE_SEQUENCES))
+
+# Same, on UTF-8 encoded text (each byte spelled as the latin-1 character of same value)
+_MOJIBAKE_UTF8_RE = re.compile(
+    _prefix_tree_pattern(
+        [seq.encode().decode("latin-1") for seq in _MOJIBAKE_SEQUENCES]
+    ).encode("latin-1")
+)
+
+
+def json_may_contain_latin_mojibake(payload: bytes) -> bool:
+    # Single scan of a whole UTF-8 JSON payload: when False, fix_latin_mojibake
+    # would leave all of its strings unchanged. Characters escaped as \uXXXX
+    # cannot be told apart at this level, so their presence answers True.
+    return b"\\u" in payload or _MOJIBAKE_UTF8_RE.search(payload) is not None
 
 
 def fix_latin_mojibake(s):
-    # List from http://www.i18nqa.com/debug/utf8-debug.html
-    moji = [
-        "\xC2\xA0",  # 'NO-BREAK SPACE' (U+00A0)
-        "\xC2\xA1",  # "¡"
-        "\xC2\xA2",  # "¢"
-        "\xC2\xA3",  # "£"
-        "\xC2\xA4",  # "¤"
-        "\xC2\xA5",  # "¥"
-        "\xC2\xA6",  # "¦"
-        "\xC2\xA7",  # "§"
-        "\xC2\xA8",  # "¨"
-        "\xC2\xA9",  # "©"
-        "\xC2\xAA",  # "ª"
-        "\xC2\xAB",  # "«"
-        "\xC2\xAC",  # "¬"
-        "\xC2\xAD",  # 'SOFT HYPHEN' (U+00AD)
-        "\xC2\xAE",  # "®"
-        "\xC2\xAF",  # "¯"
-        "\xC2\xB0",  # "°"
-        "\xC2\xB1",  # "±"
-        "\xC2\xB2",  # "²"
-        "\xC2\xB3",  # "³"
-        "\xC2\xB4",  # "´"
-        "\xC2\xB5",  # "µ"
-        "\xC2\xB6",  # "¶"
-        "\xC2\xB7",  # "·"
-        "\xC2\xB8",  # "¸"
-        "\xC2\xB9",  # "¹"
-        "\xC2\xBA",  # "º"
-        "\xC2\xBB",  # "»"
-        "\xC2\xBC",  # "¼"
-        "\xC2\xBD",  # "½"
-        "\xC2\xBE",  # "¾"
-        "\xC2\xBF",  # "¿"
-        "\xC3\x80",  # "À"
-        "\xC3\x81",  # "Á"
-        "\xC3\x82",  # "Â"
-        "\xC3\x83",  # "Ã"
-        "\xC3\x84",  # "Ä"
-        "\xC3\x85",  # "Å"
-        "\xC3\x86",  # "Æ"
-        "\xC3\x87",  # "Ç"
-        "\xC3\x88",  # "È"
-        "\xC3\x89",  # "É"
-        "\xC3\x8A",  # "Ê"
-        "\xC3\x8B",  # "Ë"
-        "\xC3\x8C",  # "Ì"
-        "\xC3\x8D",  # "Í"
-        "\xC3\x8E",  # "Î"
-        "\xC3\x8F",  # "Ï"
-        "\xC3\x90",  # "Ð"
-        "\xC3\x91",  # "Ñ"
-        "\xC3\x92",  # "Ò"
-        "\xC3\x93",  # "Ó"
-        "\xC3\x94",  # "Ô"
-        "\xC3\x95",  # "Õ"
-        "\xC3\x96",  # "Ö"
-        "\xC3\x97",  # "×"
-        "\xC3\x98",  # "Ø"
-        "\xC3\x99",  # "Ù"
-        "\xC3\x9A",  # "Ú"
-        "\xC3\x9B",  # "Û"
-        "\xC3\x9C",  # "Ü"
-        "\xC3\x9D",  # "Ý"
-        "\xC3\x9E",  # "Þ"
-        "\xC3\x9F",  # "ß"
-        "\xC3\xA0",  # "à"
-        "\xC3\xA1",  # "á"
-        "\xC3\xA2",  # "â"
-        "\xC3\xA3",  # "ã"
-        "\xC3\xA4",  # "ä"
-        "\xC3\xA5",  # "å"
-        "\xC3\xA6",  # "æ"
-        "\xC3\xA7",  # "ç"
-        "\xC3\xA8",  # "è"
-        "\xC3\xA9",  # "é"
-        "\xC3\xAA",  # "ê"
-        "\xC3\xAB",  # "ë"
-        "\xC3\xAC",  # "ì"
-        "\xC3\xAD",  # "í"
-        "\xC3\xAE",  # "î"
-        "\xC3\xAF",  # "ï"
-        "\xC3\xB0",  # "ð"
-        "\xC3\xB1",  # "ñ"
-        "\xC3\xB2",  # "ò"
-        "\xC3\xB3",  # "ó"
-        "\xC3\xB4",  # "ô"
-        "\xC3\xB5",  # "õ"
-        "\xC3\xB6",  # "ö"
-        "\xC3\xB7",  # "÷"
-        "\xC3\xB8",  # "ø"
-        "\xC3\xB9",  # "ù"
-        "\xC3\xBA",  # "ú"
-        "\xC3\xBB",  # "û"
-        "\xC3\xBC",  # "ü"
-        "\xC3\xBD",  # "ý"
-        "\xC3\xBE",  # "þ"
-        "\xC3\xBF",  # "ÿ"
-        "\xC5\x92",  # "Œ"
-        "\xC5\x93",  # "œ"
-        "\xC5\xA0",  # "Š"
-        "\xC5\xA1",  # "š"
-        "\xC5\xB8",  # "Ÿ"
-        "\xC5\xBD",  # "Ž"
-        "\xC5\xBE",  # "ž"
-        "\xC6\x92",  # "ƒ"
-        "\xCB\x86",  # "ˆ"
-        "\xCB\x9C",  # "˜"
-        "\xE2\x80\x93",  # "–"
-        "\xE2\x80\x94",  # "—"
-        "\xE2\x80\x98",  # "‘"
-        "\xE2\x80\x99",  # "’"
-        "\xE2\x80\x9A",  # "‚"
-        "\xE2\x80\x9C",  # "“"
-        "\xE2\x80\x9D",  # "”"
-        "\xE2\x80\x9E",  # "„"
-        "\xE2\x80\xA0",  # "†"
-        "\xE2\x80\xA1",  # "‡"
-        "\xE2\x80\xA2",  # "•"
-        "\xE2\x80\xA6",  # "…"
-        "\xE2\x80\xB0",  # "‰"
-        "\xE2\x80\xB9",  # "‹"
-        "\xE2\x80\xBA",  # "›"
-        "\xE2\x82\xAC",  # "€"
-        "\xE2\x84\xA2",  # "™"
-    ]
-    is_moji = False
-    for pattern in moji:
-        if pattern in s:
-            is_moji = True
-            break
-
-    if is_moji:
+    # All the sequences start with a non-ASCII character
+    if s.isascii():
+        return s
+    # Only the detection and the fix are cached: the reporting below happens on
+    # every occurrence of a string
+    if len(s) <= _CACHED_MAX_LENGTH:
+        found = _find_latin_mojibake_fix_cached(s)
+    else:
+        found = _find_latin_mojibake_fix(s)
+    if found is None:
+        return s
+
+    fixed, error = found
+    print(
+        "Detected likely ISO-8859-xx / latin1 / win-1252 mojibake: {}".format(s)
+    )  # TODO: use logging
+    if error is not None:
         print(
-            "Detected likely ISO-8859-xx / latin1 / win-1252 mojibake: {}".format(s)
-        )  # TODO: use logging
-        try:
-            return s.encode("windows-1252").decode()
-        except Exception as e:
-            # Can fail (e.g. mojibake mixed with UTF-8 content, like "Móc cùi đề DÃ©railleur")
-            # UnicodeEncodeError: 'charmap' codec can't encode characters in position 8-9: character maps to <undefined>
-            print(
-                'Failed to fix suspected mojibake "{}", error returned: {}'.format(
-                    s, str(e)
-                )
-            )  # TODO: use logging, with warning level (not normal)
-            pass
-
-    return s
+            'Failed to fix suspected mojibake "{}", error returned: {}'.format(
+                s, str(error)
+            )
+        )  # TODO: use logging, with warning level (not normal)
+        return s
+    return fixed
+
+
+# Characters that windows-1252 cannot encode (anything but the 251 it maps)
+_NON_WINDOWS_1252_RE = re.compile(
+    "[^{}]+".format(
+        re.escape(
+            "".join(
+                bytes([b]).decode("windows-1252", errors="ignore") for b in range(256)
+            )
+        )
+    )
+)
+
+
+def _find_latin_mojibake_fix(s):
+    # None if no mojibake is suspected, else a tuple of the fixed string and None,
+    # or of None and the error that prevented the fix
+    if _MOJIBAKE_RE.search(s) is None:
+        return None
+    # Can fail (e.g. mojibake mixed with UTF-8 content, like "Móc cùi đề DÃ©railleur")
+    # UnicodeEncodeError: 'charmap' codec can't encode characters in position 8-9: character maps to <undefined>
+    # which is known upfront, without trying to encode (same error as the codec's)
+    m = _NON_WINDOWS_1252_RE.search(s)
+    if m is not None:
+        return None, UnicodeEncodeError(
+            "charmap", s, m.start(), m.end(), "character maps to <undefined>"
+        )
+    try:
+        return s.encode("windows-1252").decode(), None
+    except Exception as e:
+        # Re-encoded, but not valid UTF-8
+        return None, e
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _find_latin_mojibake_fix_cached(s):
+    return _find_latin_mojibake_fix(s)
+
+
+# Content types (besides text/*) that are text, even without a charset
+_TEXT_CONTENT_TYPE_HINTS = ("json", "xml", "javascript", "html")
+
+
+def is_text_content_type(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.lower()
+    return content_type.startswith("text/") or any(
+        hint in content_type for hint in _TEXT_CONTENT_TYPE_HINTS
+    )
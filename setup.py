@@ -31,5 +31,12 @@ setup(
     #
     packages=find_packages(exclude=["contrib", "docs", "tests"]),  # Required
     python_requires=">=3.9",
-    install_requires=["requests", "cchardet"],
+    install_requires=["requests", "charset-normalizer"],
+    extras_require={
+        "async": ["httpx"],
+        "http2": ["httpx[http2]"],
+        "orjson": ["orjson"],
+        "lxml": ["lxml"],
+        "ijson": ["ijson"],
+    },
 )